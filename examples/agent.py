@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import asyncio
-from typing import TYPE_CHECKING
+import operator
+from typing import TYPE_CHECKING, Any
 
 from acp import (
     PROTOCOL_VERSION,
@@ -19,6 +20,8 @@ from acp.schema import AgentMessageChunk, TextContentBlock
 
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
     from acp import (
         AuthenticateRequest,
         CancelNotification,
@@ -29,6 +32,33 @@ if TYPE_CHECKING:
     )
 
 
+PREFIX = "Client sent: "
+
+
+def _chunks(session_id: str, texts: Iterable[str]) -> Iterator[SessionNotification]:
+    # Outbound notifications are built from trusted data, so skip validation.
+    # session_update_batch serializes each item before pulling the next, which
+    # lets a single notification be reused with its text swapped in place.
+    content = TextContentBlock.model_construct(text="")
+    update = AgentMessageChunk.model_construct(content=content)
+    notification = SessionNotification.model_construct(
+        session_id=session_id, update=update
+    )
+    for text in texts:
+        content.text = text
+        yield notification
+
+
+def _mixed_text(block: Any) -> str:
+    if isinstance(block, dict):
+        # tolerate raw dicts
+        if block.get("type") == "text":
+            return str(block.get("text", ""))
+        return f"<{block.get('type', 'content')}>"
+    # pydantic model TextContentBlock
+    return getattr(block, "text", "<content>")
+
+
 class ExampleAgent(Agent):
     def __init__(self, conn: AgentSideConnection) -> None:
         self._conn = conn
@@ -58,26 +88,31 @@ class ExampleAgent(Agent):
         return SetSessionModeResponse()
 
     async def prompt(self, params: PromptRequest) -> PromptResponse:
-        # Stream a couple of agent message chunks, then end the turn
-        # 1) Prefix
-        update = AgentMessageChunk(content=TextContentBlock(text="Client sent: "))
-        notification = SessionNotification(session_id=params.session_id, update=update)
-        await self._conn.sessionUpdate(notification)
-        # 2) Echo text blocks
-        for block in params.prompt:
-            if isinstance(block, dict):
-                # tolerate raw dicts
-                if block.get("type") == "text":
-                    text = str(block.get("text", ""))
-                else:
-                    text = f"<{block.get('type', 'content')}>"
-            else:
-                # pydantic model TextContentBlock
-                text = getattr(block, "text", "<content>")
-            update = AgentMessageChunk(content=TextContentBlock(text=text))
-            await self._conn.sessionUpdate(
-                SessionNotification(session_id=params.session_id, update=update)
-            )
+        # Stream a couple of agent message chunks, then end the turn.
+        # All chunks are collected and flushed to the client in a single write.
+        # Resolve per-prompt lookups once instead of on every block
+        texts: list[str] = []
+        append = texts.append
+        # Validated prompts only contain models, so pick the extractor once;
+        # raw dicts fall back to the tolerant mixed variant.
+        prompt = params.prompt
+        if prompt and isinstance(prompt[0], dict):
+            extract = _mixed_text
+        else:
+            extract = operator.attrgetter("text")
+        # Echo text blocks, merging the prefix into the first one
+        prefix = PREFIX
+        for block in prompt:
+            try:
+                text = extract(block)
+            except AttributeError:
+                # heterogeneous prompt or non-text block
+                text = _mixed_text(block)
+            append(prefix + text)
+            prefix = ""
+        if not texts:
+            append(PREFIX)
+        await self._conn.session_update_batch(_chunks(params.session_id, texts))
         return PromptResponse(stop_reason="end_turn")
 
     async def cancel(self, params: CancelNotification) -> None:
@@ -93,9 +128,14 @@ class ExampleAgent(Agent):
 async def main() -> None:
     reader, writer = await stdio_streams()
     # For an agent process, local writes go to client stdin (writer=stdout)
-    AgentSideConnection(lambda conn: ExampleAgent(conn), writer, reader)
-    await asyncio.Event().wait()
+    conn = AgentSideConnection(lambda conn: ExampleAgent(conn), writer, reader)
+    # Exit once the client closes our stdin
+    await conn.wait_closed()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        from uvloop import new_event_loop
+    except ImportError:  # optional, installed with the speedups extra
+        new_event_loop = None
+    asyncio.run(main(), loop_factory=new_event_loop)
@@ -2,7 +2,8 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
-from pathlib import Path
+import functools
+import os
 import sys
 from typing import TYPE_CHECKING
 
@@ -13,52 +14,210 @@ from acp import (
     InitializeRequest,
     NewSessionRequest,
     PromptRequest,
+    connect_buffered_read_pipe,
 )
-from acp.schema import TextContentBlock
+from acp.schema import AgentMessageChunk, TextContentBlock
 
 
 if TYPE_CHECKING:
-    from acp import SessionNotification
+    from collections.abc import AsyncIterator
+
+    from acp import FrameReader, SessionNotification
+
+# Large buffers let bursts of streamed agent chunks be consumed in few reads
+STREAM_LIMIT = 1 << 20
+PIPE_BUFFER_SIZE = 1 << 20
+AGENT_PREFIX = "| Agent: "
+# Longest a partial line of agent output is held back before being printed
+FLUSH_DELAY = 0.05
+# Seconds the agent gets to exit before it is signalled (once per escalation step)
+SHUTDOWN_TIMEOUT = 1.0
 
 
 class ExampleClient(Client):
-    async def sessionUpdate(self, params: SessionNotification) -> None:
+    """Prints agent message chunks, writing whole lines instead of one per chunk."""
+
+    def __init__(self) -> None:
+        self._line_buf: list[str] = []
+        self._at_line_start = True
+        self._flush_handle: asyncio.TimerHandle | None = None
+
+    async def session_update(self, params: SessionNotification) -> None:
         update = params.update
-        kind = (
-            getattr(update, "sessionUpdate", None)
-            if not isinstance(update, dict)
-            else update.get("sessionUpdate")
+        if not isinstance(update, AgentMessageChunk):
+            return
+        content = update.content
+        text = content.text if isinstance(content, TextContentBlock) else "<content>"
+        self._line_buf.append(text)
+        if "\n" in text:
+            self._flush()
+        elif self._flush_handle is None:
+            # Cap the latency of a partial line
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(FLUSH_DELAY, self._flush)
+
+    def end_turn(self) -> None:
+        """Flush pending output and terminate the current line."""
+        self._flush()
+        if not self._at_line_start:
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+            self._at_line_start = True
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._line_buf:
+            return
+        text = "".join(self._line_buf)
+        self._line_buf.clear()
+        out = text.replace("\n", "\n" + AGENT_PREFIX)
+        if text.endswith("\n"):
+            out = out.removesuffix(AGENT_PREFIX)
+        if self._at_line_start:
+            out = AGENT_PREFIX + out
+        self._at_line_start = text.endswith("\n")
+        sys.stdout.write(out)
+        sys.stdout.flush()
+
+
+def _grow_pipe_buffer(fd: int) -> None:
+    """Raise the kernel buffer size of a pipe (Linux only, best effort)."""
+    if sys.platform != "linux":
+        return
+    import fcntl
+
+    if hasattr(fcntl, "F_SETPIPE_SZ"):
+        with contextlib.suppress(OSError):
+            fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, PIPE_BUFFER_SIZE)
+
+
+async def _spawn_agent(
+    args: list[str],
+) -> tuple[asyncio.subprocess.Process, asyncio.StreamReader | FrameReader]:
+    """Start the agent with its stdout on a pipe we own.
+
+    Owning the pipe lets it be enlarged and read into a `FrameReader` without an
+    extra copy. The Windows Proactor loop cannot read anonymous pipes, so there the
+    subprocess-managed pipe is used as is.
+    """
+    if sys.platform == "win32":
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable,
+            *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=STREAM_LIMIT,
         )
-        if kind == "agent_message_chunk":
-            # Handle both dict and model shapes
-            content = (
-                update["content"]
-                if isinstance(update, dict)
-                else getattr(update, "content", None)
-            )
-
-            text = (
-                content.get("text")
-                if isinstance(content, dict)
-                else getattr(content, "text", "<content>")
-            )
-            print(f"| Agent: {text}")
-
-
-async def interactive_loop(conn: ClientSideConnection, session_id: str) -> None:
-    loop = asyncio.get_running_loop()
+        assert proc.stdout
+        return proc, proc.stdout
+
+    read_fd, write_fd = os.pipe()
+    _grow_pipe_buffer(read_fd)
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable,
+            *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=write_fd,
+        )
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+    assert proc.stdin
+    # uvloop transports do not expose the pipe object
+    if (stdin_pipe := proc.stdin.get_extra_info("pipe")) is not None:
+        _grow_pipe_buffer(stdin_pipe.fileno())
+    pipe = os.fdopen(read_fd, "rb", buffering=0)
+    return proc, await connect_buffered_read_pipe(
+        pipe, buffer_size=STREAM_LIMIT, limit=STREAM_LIMIT
+    )
+
+
+async def _stop_agent(proc: asyncio.subprocess.Process) -> None:
+    """Let the agent exit on EOF, escalating to SIGTERM and then SIGKILL."""
+    assert proc.stdin
+    proc.stdin.close()
+    for stop in (proc.terminate, proc.kill):
+        try:
+            await asyncio.wait_for(proc.wait(), SHUTDOWN_TIMEOUT)
+        except TimeoutError:
+            with contextlib.suppress(ProcessLookupError):
+                stop()
+        else:
+            return
+    await proc.wait()
+
+
+async def _executor_lines(loop: asyncio.AbstractEventLoop) -> AsyncIterator[str]:
+    read_line = functools.partial(input, "> ")
     while True:
         try:
-            line = await loop.run_in_executor(None, lambda: input("> "))
+            yield await loop.run_in_executor(None, read_line)
         except EOFError:
-            break
-        if not line:
-            continue
-        try:
-            block = TextContentBlock(text=line)
-            await conn.prompt(PromptRequest(session_id=session_id, prompt=[block]))
-        except Exception as e:  # noqa: BLE001
-            print(f"error: {e}", file=sys.stderr)
+            return
+
+
+async def _stdin_lines() -> AsyncIterator[str]:
+    """Yield REPL lines from stdin until EOF.
+
+    Stdin is read on the event loop when it is a pipe. TTYs, regular files and loops
+    without pipe support (e.g. Windows) fall back to input() in an executor. A
+    terminal's fds 0-2 share one file description, so reading it on the loop would
+    make stdout non-blocking too.
+    """
+    loop = asyncio.get_running_loop()
+    if sys.platform == "win32" or sys.stdin.isatty():
+        async for line in _executor_lines(loop):
+            yield line
+        return
+
+    fd = sys.stdin.fileno()
+    was_blocking = os.get_blocking(fd)
+    reader = asyncio.StreamReader()
+    # Hand the transport a duplicate so closing it leaves sys.stdin open
+    pipe = os.fdopen(os.dup(fd), "rb", buffering=0)
+    try:
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), pipe
+        )
+    except (ValueError, NotImplementedError):
+        pipe.close()
+        async for line in _executor_lines(loop):
+            yield line
+        return
+
+    try:
+        while True:
+            sys.stdout.write("> ")
+            sys.stdout.flush()
+            data = await reader.readline()
+            if not data:
+                return
+            yield data.decode().rstrip("\n")
+    finally:
+        transport.close()
+        # The transport switched the shared file description to O_NONBLOCK
+        os.set_blocking(fd, was_blocking)
+
+
+async def interactive_loop(
+    conn: ClientSideConnection, client: ExampleClient, session_id: str
+) -> None:
+    async with contextlib.aclosing(_stdin_lines()) as lines:
+        async for line in lines:
+            if not line:
+                continue
+            try:
+                block = TextContentBlock(text=line)
+                await conn.prompt(PromptRequest(session_id=session_id, prompt=[block]))
+            except Exception as e:  # noqa: BLE001
+                print(f"error: {e}", file=sys.stderr)
+            finally:
+                client.end_turn()
 
 
 async def main(argv: list[str]) -> int:
@@ -67,33 +226,36 @@ async def main(argv: list[str]) -> int:
         return 2
 
     # Spawn agent subprocess
-    proc = await asyncio.create_subprocess_exec(
-        sys.executable,
-        *argv[1:],
-        stdin=asyncio.subprocess.PIPE,
-        stdout=asyncio.subprocess.PIPE,
-    )
+    proc, stdout = await _spawn_agent(argv[1:])
     assert proc.stdin
-    assert proc.stdout
 
     # Connect to agent stdio
-    conn = ClientSideConnection(lambda _agent: ExampleClient(), proc.stdin, proc.stdout)  # pyright: ignore[reportAbstractUsage]
+    client = ExampleClient()
+    conn = ClientSideConnection(lambda _agent: client, proc.stdin, stdout)  # pyright: ignore[reportAbstractUsage]
 
-    # Initialize and create session
+    # Initialize and create session. Both requests are sent back to back: the agent
+    # handles requests without a session one after another, in arrival order, so
+    # new_session still runs after initialize without the client first waiting a
+    # round trip for the initialize response.
     init_request = InitializeRequest(
         protocol_version=PROTOCOL_VERSION, client_capabilities=None
     )
-    await conn.initialize(init_request)
-    request = NewSessionRequest(mcp_servers=[], cwd=str(Path.cwd().resolve()))
-    new_sess = await conn.newSession(request)
+    request = NewSessionRequest(mcp_servers=[], cwd=os.getcwd())  # noqa: PTH109
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(conn.initialize(init_request))
+        session_task = tg.create_task(conn.new_session(request))
+    new_sess = session_task.result()
 
     # Run REPL until EOF
-    await interactive_loop(conn, new_sess.session_id)
+    await interactive_loop(conn, client, new_sess.session_id)
 
-    with contextlib.suppress(ProcessLookupError):
-        proc.terminate()
+    await _stop_agent(proc)
     return 0
 
 
 if __name__ == "__main__":
-    raise SystemExit(asyncio.run(main(sys.argv)))
+    try:
+        from uvloop import new_event_loop
+    except ImportError:  # optional, installed with the speedups extra
+        new_event_loop = None
+    raise SystemExit(asyncio.run(main(sys.argv), loop_factory=new_event_loop))
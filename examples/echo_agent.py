@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import asyncio
-from typing import TYPE_CHECKING
+import operator
+from typing import TYPE_CHECKING, Any
 
 from acp import (
     Agent,
@@ -9,10 +10,8 @@ from acp import (
     InitializeResponse,
     NewSessionResponse,
     PromptResponse,
-    SessionNotification,
     stdio_streams,
 )
-from acp.schema import AgentMessageChunk, TextContentBlock
 
 
 if TYPE_CHECKING:
@@ -23,6 +22,12 @@ if TYPE_CHECKING:
     )
 
 
+def _mixed_text(block: Any) -> str:
+    return (
+        block.get("text", "") if isinstance(block, dict) else getattr(block, "text", "")
+    )
+
+
 class EchoAgent(Agent):
     def __init__(self, conn: AgentSideConnection):
         self._conn = conn
@@ -34,28 +39,34 @@ class EchoAgent(Agent):
         return NewSessionResponse(session_id="sess-1")
 
     async def prompt(self, params: PromptRequest) -> PromptResponse:
-        for block in params.prompt:
-            text = (
-                block.get("text", "")
-                if isinstance(block, dict)
-                else getattr(block, "text", "")
-            )
-            await self._conn.sessionUpdate(
-                SessionNotification(
-                    session_id=params.session_id,
-                    update=AgentMessageChunk(
-                        content=TextContentBlock(text=text),
-                    ),
-                )
-            )
+        prompt = params.prompt
+        if prompt and isinstance(prompt[0], dict):
+            extract = _mixed_text
+        else:
+            extract = operator.attrgetter("text")
+        texts: list[str] = []
+        append = texts.append
+        for block in prompt:
+            try:
+                append(extract(block))
+            except AttributeError:
+                # heterogeneous prompt or non-text block
+                append(_mixed_text(block))
+        # Frames are rendered from a template; only the text is serialized per block
+        await self._conn.send_message_chunks(params.session_id, texts)
         return PromptResponse(stop_reason="end_turn")
 
 
 async def main() -> None:
     reader, writer = await stdio_streams()
-    AgentSideConnection(lambda conn: EchoAgent(conn), writer, reader)
-    await asyncio.Event().wait()
+    conn = AgentSideConnection(lambda conn: EchoAgent(conn), writer, reader)
+    # Exit once the client closes our stdin
+    await conn.wait_closed()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        from uvloop import new_event_loop
+    except ImportError:  # optional, installed with the speedups extra
+        new_event_loop = None
+    asyncio.run(main(), loop_factory=new_event_loop)
@@ -1,13 +1,24 @@
 from __future__ import annotations
 
 import asyncio
+import codecs
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import contextlib
+import dataclasses
 from dataclasses import dataclass, field
+import functools
+import importlib
+import io
 import json as _json
 import os
 from pathlib import Path
 import re
+import signal
+import subprocess
 import sys
+import threading
+import time
 from typing import TYPE_CHECKING, Any
 import uuid
 
@@ -37,293 +48,698 @@ from acp.schema import (
 
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
     from acp import (
         AuthenticateRequest,
         CancelNotification,
-        Client,
         InitializeRequest,
         NewSessionRequest,
         PromptRequest,
         SetSessionModeRequest,
     )
     from acp.core import ConfirmationMode
-    from acp.schema import RequestPermissionResponse
 
 REF_SRC = Path(__file__).resolve().parents[2] / "reference" / "mini-swe-agent" / "src"
 
+# Session updates are coalesced for this long (seconds), up to this many per write
+UPDATE_BATCH_WINDOW = 0.01
+UPDATE_BATCH_MAX = 64
+# Worker threads shared by all sessions for model calls and command execution
+DEFAULT_LLM_WORKERS = 4
+# Running commands report their output at most this often (seconds)
+OUTPUT_UPDATE_INTERVAL = 0.1
+OUTPUT_READ_SIZE = 8192
+# Progress updates carry at most this many trailing characters of the output
+OUTPUT_PROGRESS_CHARS = 16384
+
+
+# mini-swe-agent names used here, and the module each one comes from
+_MINI_IMPORTS = {
+    "AgentConfig": "minisweagent.agents.default",
+    "DefaultAgent": "minisweagent.agents.default",
+    "LimitsExceeded": "minisweagent.agents.default",
+    "NonTerminatingException": "minisweagent.agents.default",
+    "Submitted": "minisweagent.agents.default",
+    "LocalEnvironment": "minisweagent.environments.local",
+    "LitellmModel": "minisweagent.models.litellm_model",
+}
+
+
+def _load_mini_imports() -> dict[str, Any]:
+    """Import `_MINI_IMPORTS`, falling back to the vendored reference copy."""
+
+    def load() -> dict[str, Any]:
+        return {
+            name: getattr(importlib.import_module(module), name)
+            for name, module in _MINI_IMPORTS.items()
+        }
+
+    try:
+        return load()
+    except Exception:
+        if not REF_SRC.is_dir():
+            raise
+        if str(REF_SRC) not in sys.path:
+            sys.path.insert(0, str(REF_SRC))
+        return load()
+
+
+# Resolved once at import; all None (with the reason kept) if unavailable
+try:
+    _mini = _load_mini_imports()
+except Exception as e:  # noqa: BLE001
+    _mini = dict.fromkeys(_MINI_IMPORTS)
+    _MINI_IMPORT_ERROR: str | None = str(e) or type(e).__name__
+else:
+    _MINI_IMPORT_ERROR = None
+_BaseCfg = _mini["AgentConfig"]
+DefaultAgent = _mini["DefaultAgent"]
+LimitsExceeded = _mini["LimitsExceeded"]
+NonTerminatingException = _mini["NonTerminatingException"]
+Submitted = _mini["Submitted"]
+LocalEnvironment = _mini["LocalEnvironment"]
+LitellmModel = _mini["LitellmModel"]
+
+
+_BASH_RE = re.compile(r"```bash\n(.*?)\n```", re.DOTALL)
+# Step errors that mean the user stopped the command rather than it failing
+_CANCEL_RE = re.compile(
+    r"Command not executed|Switching to human mode|switched to manual mode"
+    r"|Interrupted by user"
+)
 
-@dataclass
+# Offered with every permission request; built once and shared
+_PERMISSION_OPTIONS = (
+    PermissionOption(option_id="allow-once", name="Allow once", kind="allow_once"),
+    PermissionOption(option_id="reject-once", name="Reject", kind="reject_once"),
+)
+
+
+@dataclass(slots=True)
 class ACPAgentConfig:  # Extra controls layered on top of mini-swe-agent defaults
     mode: ConfirmationMode = "confirm"
-    whitelist_actions: list[str] = field(default_factory=list)
+    # Commands matching any of these run without asking for permission
+    whitelist_actions: list[re.Pattern[str]] = field(default_factory=list)
     confirm_exit: bool = True
 
+    def __post_init__(self) -> None:
+        self.whitelist_actions = [re.compile(p) for p in self.whitelist_actions]
 
-def _create_streaming_mini_agent(
-    *,
-    client: Client,
-    session_id: str,
-    cwd: str,
-    model_name: str,
-    model_kwargs: dict[str, Any],
-    loop: asyncio.AbstractEventLoop,
-    ext_config: ACPAgentConfig,
-):
-    """Create a DefaultAgent that emits ACP session/update events during execution.
 
-    Returns (agent, error_message_if_any).
+@dataclass(slots=True)
+class Session:
+    cwd: str
+    agent: Any = None
+    # Current task; None until the first prompt of a task arrives
+    task: str | None = None
+    config: ACPAgentConfig = field(default_factory=ACPAgentConfig)
+    # One model step at a time per session
+    llm_sem: asyncio.Semaphore = field(default_factory=asyncio.Semaphore)
+
+
+@functools.lru_cache(maxsize=1)
+def _load_default_config() -> ACPAgentConfig:
+    """Session config template from MINI_SWE_WHITELIST / MINI_SWE_CONFIRM_EXIT.
+
+    The environment is read once per process; sessions take a copy with
+    `dataclasses.replace` so they can change their mode independently.
     """
+    cfg = ACPAgentConfig()
     try:
-        try:
-            from minisweagent.agents.default import (
-                AgentConfig as _BaseCfg,
-                DefaultAgent,
-                LimitsExceeded,
-                NonTerminatingException,
-                Submitted,
-            )  # type: ignore
-            from minisweagent.environments.local import LocalEnvironment  # type: ignore
-            from minisweagent.models.litellm_model import LitellmModel  # type: ignore
-        except Exception:
-            # Fallback to vendored reference copy if available
-
-            if REF_SRC.is_dir():
-                if str(REF_SRC) not in sys.path:
-                    sys.path.insert(0, str(REF_SRC))
-                from minisweagent.agents.default import (
-                    AgentConfig as _BaseCfg,
-                    DefaultAgent,
-                    LimitsExceeded,
-                    NonTerminatingException,
-                    Submitted,
-                )  # type: ignore
-                from minisweagent.environments.local import (
-                    LocalEnvironment,  # type: ignore
-                )
-                from minisweagent.models.litellm_model import LitellmModel  # type: ignore
-            else:
-                raise
+        wl = os.getenv("MINI_SWE_WHITELIST", "[]")
+        cfg.whitelist_actions = [re.compile(p) for p in _json.loads(wl)] if wl else []
+    except Exception:  # noqa: BLE001
+        pass
+    ce = os.getenv("MINI_SWE_CONFIRM_EXIT")
+    if ce is not None:
+        cfg.confirm_exit = ce.lower() not in ("0", "false", "no")
+    return cfg
+
+
+@functools.lru_cache(maxsize=1)
+def _load_model_settings() -> tuple[str, dict[str, Any]]:
+    """Model name and kwargs from MINI_SWE_MODEL / MINI_SWE_MODEL_KWARGS, read once."""
+    model_name = os.getenv("MINI_SWE_MODEL", os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+    try:
+        model_kwargs = _json.loads(os.getenv("MINI_SWE_MODEL_KWARGS", "{}"))
+        if not isinstance(model_kwargs, dict):
+            model_kwargs = {}
+    except Exception:  # noqa: BLE001
+        model_kwargs = {}
+    return model_name, model_kwargs
 
-        class _StreamingMiniAgent(DefaultAgent):  # type: ignore[misc]
-            def __init__(self) -> None:
-                self._acp_client = client
-                self._session_id = session_id
-                self._tool_seq = 0
-                self._loop = loop
-                self._background_tasks: set = set()
-                # expose mini-swe-agent exception types for outer loop
-                self._Submitted = Submitted
-                self._NonTerminatingException = NonTerminatingException
-                self._LimitsExceeded = LimitsExceeded
-                model = LitellmModel(model_name=model_name, model_kwargs=model_kwargs)
-                env = LocalEnvironment(cwd=cwd)
-                super().__init__(model=model, env=env, config_class=_BaseCfg)
-                # extra config
-                self.acp_config = ext_config
-                # During initial seeding (system/user templates), suppress updates
-                self._emit_updates = False
-
-            # --- ACP streaming helpers ---
-
-            def _schedule(self, coro):
-                import asyncio as _asyncio
-
-                return _asyncio.run_coroutine_threadsafe(coro, self._loop)
-
-            async def _send(self, update_model) -> None:
-                await self._acp_client.sessionUpdate(
-                    SessionNotification(session_id=self._session_id, update=update_model)
-                )
 
-            def _send_cost_hint(self) -> None:
-                try:
-                    cost = float(getattr(self.model, "cost", 0.0))
-                except Exception:  # noqa: BLE001
-                    cost = 0.0
-                hint = AgentThoughtChunk(
-                    content=TextContentBlock(text=f"__COST__:{cost:.2f}"),
+# Outgoing models are built from trusted data, so they skip validation
+
+
+def _text_block(text: str) -> TextContentBlock:
+    return TextContentBlock.model_construct(text=text)
+
+
+def _msg_chunk(text: str) -> AgentMessageChunk:
+    return AgentMessageChunk.model_construct(content=_text_block(text))
+
+
+def _tool_content(text: str) -> list[ContentToolCallContent]:
+    return [ContentToolCallContent.model_construct(content=_text_block(text))]
+
+
+def _bash_content(command: str) -> list[ContentToolCallContent]:
+    return _tool_content(f"```bash\n{command}\n```")
+
+
+def _tool_start(
+    tool_call_id: str,
+    title: str,
+    command: str,
+    content: list[ContentToolCallContent],
+) -> ToolCallStart:
+    return ToolCallStart.model_construct(
+        tool_call_id=tool_call_id,
+        title=title,
+        kind="execute",
+        status="pending",
+        content=content,
+        raw_input={"command": command},
+    )
+
+
+def _parse_prompt_blocks(blocks: list[Any]) -> tuple[str | None, list[str]]:
+    """Return the first bash command and the task text of a prompt.
+
+    Both come from the text blocks, so they are collected in one pass.
+    """
+    code: str | None = None
+    task_parts: list[str] = []
+    for block in blocks:
+        if getattr(block, "type", None) != "text":
+            continue
+        text = getattr(block, "text", "") or ""
+        if code is None and (m := _BASH_RE.search(text)):
+            code = m.group(1).strip()
+        if text and not text.strip().startswith("[[MODE:"):
+            task_parts.append(str(text))
+    return code, task_parts
+
+
+def _merge_text_chunks(updates: list[Any]) -> list[Any]:
+    """Concatenate runs of consecutive plain-text agent message chunks."""
+    merged: list[Any] = []
+    for update in updates:
+        prev = merged[-1] if merged else None
+        if (
+            isinstance(prev, AgentMessageChunk)
+            and isinstance(update, AgentMessageChunk)
+            and isinstance(prev.content, TextContentBlock)
+            and isinstance(update.content, TextContentBlock)
+        ):
+            text = prev.content.text + update.content.text
+            merged[-1] = _msg_chunk(text)
+        else:
+            merged.append(update)
+    return merged
+
+
+def _drop_stale_output(updates: list[Any]) -> list[Any]:
+    """Drop running-output updates that a later one in the batch replaces."""
+    latest: dict[str, int] = {}
+    for i, update in enumerate(updates):
+        if _is_output_update(update):
+            latest[update.tool_call_id] = i
+    return [
+        update
+        for i, update in enumerate(updates)
+        if not _is_output_update(update) or latest[update.tool_call_id] == i
+    ]
+
+
+def _is_output_update(update: Any) -> bool:
+    return (
+        isinstance(update, ToolCallProgress)
+        and update.status == "in_progress"
+        and update.content is not None
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_template(source: str) -> Any:
+    """Jinja template for `source`, compiled once per process."""
+    from jinja2 import StrictUndefined, Template
+
+    return Template(source, undefined=StrictUndefined)
+
+
+@functools.lru_cache(maxsize=1)
+def _streaming_agent_class() -> type:
+    """Build the streaming DefaultAgent subclass, once."""
+
+    class _StreamingEnvironment(LocalEnvironment):  # type: ignore[misc]
+        """LocalEnvironment that reports partial output while a command runs."""
+
+        def __init__(self, **kwargs: Any) -> None:
+            super().__init__(**kwargs)
+            # Called from the worker thread with the tail of the output so far
+            self.on_output: Callable[[str], None] | None = None
+
+        def execute(self, command: str, cwd: str = "", *, timeout: int | None = None):
+            on_output = self.on_output
+            if on_output is None:
+                return super().execute(command, cwd, timeout=timeout)
+            timeout = timeout or self.config.timeout
+            proc = subprocess.Popen(
+                command,
+                shell=True,
+                cwd=cwd or self.config.cwd or Path.cwd(),
+                env=os.environ | self.config.env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                bufsize=0,
+                # Own process group, so a timeout also kills background children
+                # that would otherwise keep the pipe open
+                start_new_session=True,
+            )
+            timed_out = threading.Event()
+
+            def kill() -> None:
+                timed_out.set()
+                if sys.platform == "win32":
+                    proc.kill()
+                    return
+                with contextlib.suppress(ProcessLookupError):
+                    os.killpg(proc.pid, signal.SIGKILL)
+
+            def tail() -> str:
+                # Join only as many trailing parts as the progress update shows
+                size = 0
+                start = len(parts)
+                while start and size < OUTPUT_PROGRESS_CHARS:
+                    start -= 1
+                    size += len(parts[start])
+                return "".join(parts[start:])[-OUTPUT_PROGRESS_CHARS:]
+
+            killer = threading.Timer(timeout, kill)
+            killer.start()
+            # Same decoding as subprocess.run(text=True, errors="replace")
+            decoder = io.IncrementalNewlineDecoder(
+                codecs.getincrementaldecoder("utf-8")(errors="replace"), translate=True
+            )
+            parts: list[str] = []
+            buf = bytearray(OUTPUT_READ_SIZE)
+            # Commands that finish quickly only send the final update
+            last_report = time.monotonic()
+            try:
+                with proc, memoryview(buf) as view:
+                    while nbytes := proc.stdout.readinto(buf):  # type: ignore[union-attr]
+                        parts.append(decoder.decode(view[:nbytes]))
+                        now = time.monotonic()
+                        if now - last_report >= OUTPUT_UPDATE_INTERVAL:
+                            last_report = now
+                            on_output(tail())
+                    parts.append(decoder.decode(b"", final=True))
+            finally:
+                killer.cancel()
+            output = "".join(parts)
+            if timed_out.is_set():
+                # DefaultAgent.execute_action expects the partial output as bytes
+                raise subprocess.TimeoutExpired(command, timeout, output=output.encode())
+            return {"output": output, "returncode": proc.returncode}
+
+    class _StreamingMiniAgent(DefaultAgent):  # type: ignore[misc]
+        def __init__(
+            self,
+            *,
+            client: AgentSideConnection,
+            session_id: str,
+            cwd: str,
+            model_name: str,
+            model_kwargs: dict[str, Any],
+            loop: asyncio.AbstractEventLoop,
+            ext_config: ACPAgentConfig,
+        ) -> None:
+            self._acp_client = client
+            self._session_id = session_id
+            self._tool_seq = 0
+            self._last_cost: float | None = None
+            self._approved_tool_id: str | None = None
+            self._last_emitted_text: str | None = None
+            self._loop = loop
+            # Background tasks run in this group while the agent is open, see `_run`
+            self._tg: asyncio.TaskGroup | None = None
+            self._closing: asyncio.Future[None] = loop.create_future()
+            # Coroutines handed over from worker threads, see `_schedule`
+            self._pending: collections.deque = collections.deque()
+            self._drain_scheduled = False
+            # expose mini-swe-agent exception types for outer loop
+            self._Submitted = Submitted
+            self._NonTerminatingException = NonTerminatingException
+            self._LimitsExceeded = LimitsExceeded
+            model = LitellmModel(model_name=model_name, model_kwargs=model_kwargs)
+            env = _StreamingEnvironment(cwd=cwd)
+            super().__init__(model=model, env=env, config_class=_BaseCfg)
+            # extra config
+            self.acp_config = ext_config
+            # During initial seeding (system/user templates), suppress updates
+            self._emit_updates = False
+            # Updates are queued and written in batches by a single drainer
+            self._updates: asyncio.Queue[Any] = asyncio.Queue()
+            self._runner = loop.create_task(self._run())
+
+        def render_template(self, template: str, **kwargs) -> str:
+            # Same variables as DefaultAgent.render_template, but each template
+            # source is only compiled once
+            template_vars = (
+                dataclasses.asdict(self.config)
+                | self.env.get_template_vars()
+                | self.model.get_template_vars()
+            )
+            return _compile_template(template).render(
+                **kwargs, **template_vars, **self.extra_template_vars
+            )
+
+        # --- ACP streaming helpers ---
+
+        async def _run(self) -> None:
+            """Own the update drainer and all scheduled coroutines until `close`."""
+            async with asyncio.TaskGroup() as tg:
+                self._tg = tg
+                drainer = tg.create_task(self._drain_updates())
+                self._start_pending()
+                await self._closing
+                drainer.cancel()
+                self._tg = None
+
+        async def close(self) -> None:
+            """Send the queued updates, then stop the background tasks."""
+            if self._closing.done():
+                return
+            await self.flush_updates()
+            self._closing.set_result(None)
+            await self._runner
+
+        def _schedule(self, coro) -> None:
+            """Run `coro` on the event loop; safe to call from worker threads.
+
+            Coroutines are queued and started in order by one loop callback, so a
+            burst of tool events costs a single loop wakeup.
+            """
+            if self._closing.done():
+                coro.close()
+                return
+            self._pending.append(coro)
+            if not self._drain_scheduled:
+                self._drain_scheduled = True
+                self._loop.call_soon_threadsafe(self._start_pending)
+
+        def _start_pending(self) -> None:
+            self._drain_scheduled = False
+            tg = self._tg
+            if tg is None:
+                return  # picked up once `_run` has entered the task group
+            pending = self._pending
+            while pending:
+                tg.create_task(pending.popleft())
+
+        async def _send(self, update_model) -> None:
+            self._updates.put_nowait(update_model)
+
+        async def _drain_updates(self) -> None:
+            queue = self._updates
+            while True:
+                batch = [await queue.get()]
+                # Give producers a moment so a burst goes out as one write
+                await asyncio.sleep(UPDATE_BATCH_WINDOW)
+                while len(batch) < UPDATE_BATCH_MAX and not queue.empty():
+                    batch.append(queue.get_nowait())
+                notifications = (
+                    SessionNotification.model_construct(
+                        session_id=self._session_id, update=update
+                    )
+                    for update in _merge_text_chunks(_drop_stale_output(batch))
                 )
                 try:
-                    loop = asyncio.get_running_loop()
-                    task = loop.create_task(self._send(hint))
-                    # Store reference to prevent garbage collection
-                    self._background_tasks.add(task)
-                    task.add_done_callback(self._background_tasks.discard)
-                except RuntimeError:
-                    self._schedule(self._send(hint))
-
-            async def on_tool_start(
-                self, title: str, command: str, tool_call_id: str
-            ) -> None:
-                """Send a tool_call start notification for a bash command."""
-                block = TextContentBlock(text=f"```bash\n{command}\n```")
-                update = ToolCallStart(
+                    await self._acp_client.session_update_batch(notifications)
+                except Exception:  # noqa: BLE001
+                    pass  # best effort, like any other streamed update
+                finally:
+                    for _ in batch:
+                        queue.task_done()
+
+        async def flush_updates(self) -> None:
+            """Wait until every update scheduled so far has been written."""
+            # Scheduled coroutines only enqueue, so once started a single loop
+            # turn lets them all reach the queue
+            self._start_pending()
+            await asyncio.sleep(0)
+            await self._updates.join()
+
+        async def send_message(self, text: str) -> None:
+            """Queue an agent message chunk behind the pending updates."""
+            await self._send(_msg_chunk(text))
+
+        def _send_cost_hint(self) -> None:
+            """Schedule a cost hint if the model cost changed since the last one."""
+            try:
+                cost = round(float(getattr(self.model, "cost", 0.0)), 2)
+            except Exception:  # noqa: BLE001
+                cost = 0.0
+            if cost == self._last_cost:
+                return
+            self._last_cost = cost
+            self._schedule(self._send_cost(cost))
+
+        async def _send_cost(self, cost: float) -> None:
+            hint = AgentThoughtChunk.model_construct(
+                content=_text_block(f"__COST__:{cost:.2f}"),
+            )
+            await self._send(hint)
+
+        async def on_tool_start(
+            self,
+            title: str,
+            command: str,
+            tool_call_id: str,
+            content: list[ContentToolCallContent],
+        ) -> None:
+            """Send a tool_call start notification for a bash command."""
+            await self._send(_tool_start(tool_call_id, title, command, content))
+
+        async def on_tool_output(self, tool_call_id: str, output: str) -> None:
+            """Send the output so far of a running tool call.
+
+            Tool call content is replaced on every update, so this carries the
+            latest output (its last `OUTPUT_PROGRESS_CHARS` characters), not just
+            what is new. The completion update carries all of it.
+            """
+            update = ToolCallProgress.model_construct(
+                tool_call_id=tool_call_id,
+                status="in_progress",
+                content=_tool_content(f"```ansi\n{output}\n```"),
+            )
+            await self._send(update)
+
+        def _report_output(self, tool_call_id: str, output: str) -> None:
+            self._schedule(self.on_tool_output(tool_call_id, output))
+
+        async def on_tool_complete(
+            self,
+            tool_call_id: str,
+            output: str,
+            returncode: int,
+            *,
+            status: str = "completed",
+        ) -> None:
+            """Send a tool_call_update with the final output and return code."""
+            update = ToolCallProgress.model_construct(
+                tool_call_id=tool_call_id,
+                status=status,
+                content=_tool_content(f"```ansi\n{output}\n```"),
+                raw_output={"output": output, "returncode": returncode},
+            )
+            await self._send(update)
+
+        def add_message(self, role: str, content: str, **kwargs):
+            super().add_message(role, content, **kwargs)
+            # Only stream LM output as agent_message_chunk; tool output is handled
+            # via tool_call_update.
+            if not getattr(self, "_emit_updates", True) or role != "assistant":
+                return
+            text = str(content)
+            # Nothing to show for blank output, control sentinels or a repeat of
+            # the previous message (e.g. a retried completion)
+            if (
+                not text.strip()
+                or text.startswith("__COST__:")
+                or text == self._last_emitted_text
+            ):
+                return
+            self._last_emitted_text = text
+            update = _msg_chunk(text)
+            self._schedule(self._send(update))
+            # Fire-and-forget
+
+        async def _confirm_action(
+            self,
+            tool_call_id: str,
+            command: str,
+            content: list[ContentToolCallContent],
+        ) -> bool:
+            req = RequestPermissionRequest(
+                session_id=self._session_id,
+                options=list(_PERMISSION_OPTIONS),
+                tool_call=ToolCallUpdate(
                     tool_call_id=tool_call_id,
-                    title=title,
+                    title="bash",
                     kind="execute",
                     status="pending",
-                    content=[ContentToolCallContent(content=block)],
+                    content=content,
                     raw_input={"command": command},
-                )
-                await self._send(update)
-
-            async def on_tool_complete(
-                self,
-                tool_call_id: str,
-                output: str,
-                returncode: int,
-                *,
-                status: str = "completed",
-            ) -> None:
-                """Send a tool_call_update with the final output and return code."""
-                block = TextContentBlock(text=f"```ansi\n{output}\n```")
-                content = ContentToolCallContent(content=block)
-                update = ToolCallProgress(
-                    tool_call_id=tool_call_id,
-                    status=status,
-                    content=[content],
-                    raw_output={"output": output, "returncode": returncode},
-                )
-                await self._send(update)
+                ),
+            )
+            try:
+                resp = await self._acp_client.request_permission(req)
+            except Exception:  # noqa: BLE001
+                return False
+            out = resp.outcome
+            return bool(
+                isinstance(out, AllowedOutcome)
+                and out.option_id in ("allow-once", "allow-always")
+            )
 
-            def add_message(self, role: str, content: str, **kwargs):
-                super().add_message(role, content, **kwargs)
-                # Only stream LM output as agent_message_chunk; tool output is handled
-                # via tool_call_update.
-                if not getattr(self, "_emit_updates", True) or role != "assistant":
-                    return
-                text = str(content)
-                block = TextContentBlock(text=text)
-                update = AgentMessageChunk(content=block)
-                try:
-                    loop = asyncio.get_running_loop()
-                    task = loop.create_task(self._send(update))
-                    # Store reference to prevent garbage collection
-                    self._background_tasks.add(task)
-                    task.add_done_callback(self._background_tasks.discard)
-                except RuntimeError:
-                    self._schedule(self._send(update))
-                # Fire-and-forget
-
-            def _confirm_action_sync(self, tool_call_id: str, command: str) -> bool:
-                # Build request and block until client responds
-                block = TextContentBlock(text=f"```bash\n{command}\n```")
-                req = RequestPermissionRequest(
-                    session_id=self._session_id,
-                    options=[
-                        PermissionOption(
-                            option_id="allow-once", name="Allow once", kind="allow_once"
-                        ),
-                        PermissionOption(
-                            option_id="reject-once", name="Reject", kind="reject_once"
-                        ),
-                    ],
-                    tool_call=ToolCallUpdate(
-                        tool_call_id=tool_call_id,
-                        title="bash",
-                        kind="execute",
-                        status="pending",
-                        content=[ContentToolCallContent(content=block)],
-                        raw_input={"command": command},
-                    ),
-                )
-                fut = self._schedule(self._acp_client.requestPermission(req))
-                try:
-                    resp: RequestPermissionResponse = fut.result()  # type: ignore[assignment]
-                except Exception:  # noqa: BLE001
-                    return False
-                out = resp.outcome
-                return bool(
-                    isinstance(out, AllowedOutcome)
-                    and out.option_id in ("allow-once", "allow-always")
+        async def approve_action(self, response: dict) -> None:
+            """Announce the next action and ask for permission unless whitelisted.
+
+            Runs on the event loop before `get_observation`, so waiting for the
+            user never pins a worker thread; `execute_action` picks up the
+            approved tool call.
+            """
+            command = self.parse_action(response).get("action", "")
+            self._tool_seq += 1
+            # Unique per session; the session id keeps it unique across sessions
+            tool_id = f"mini-bash-{self._session_id}-{self._tool_seq}"
+
+            # Shown by both the tool call and the permission request
+            content = _bash_content(command)
+
+            # Always create tool_call first (pending); scheduled like every other
+            # update so it stays behind the ones already queued
+            self._schedule(self.on_tool_start("bash", command, tool_id, content))
+
+            if command.strip() and not any(
+                p.match(command) for p in self.acp_config.whitelist_actions
+            ):
+                # The permission request is written straight to the connection, so
+                # the batched updates (tool_call included) have to go out first
+                await self.flush_updates()
+                approved = await self._confirm_action(tool_id, command, content)
+            else:
+                approved = True
+            if not approved:
+                # ToolCallProgress has no cancelled status; report it as failed
+                self._schedule(
+                    self.on_tool_complete(
+                        tool_id, "Permission denied by user", 0, status="failed"
+                    )
                 )
+                msg = "Command not executed: denied by user"
+                raise self._NonTerminatingException(msg)
+            self._approved_tool_id = tool_id
 
-            def execute_action(self, action: dict) -> dict:  # type: ignore[override]
-                self._tool_seq += 1
-                tool_id = f"mini-bash-{self._tool_seq}-{uuid.uuid4().hex[:8]}"
-                command = action.get("action", "")
-
-                # Always create tool_call first (pending)
-                self._schedule(self.on_tool_start("bash", command, tool_id))
-
-                # Request permission unless whitelisted
-                if command.strip() and not any(
-                    re.match(r, command) for r in self.acp_config.whitelist_actions
-                ):
-                    allowed = self._confirm_action_sync(tool_id, command)
-                    if not allowed:
-                        # Mark as cancelled/failed accordingly and abort this step
-                        self._schedule(
-                            self.on_tool_complete(
-                                tool_id,
-                                "Permission denied by user",
-                                0,
-                                status="cancelled",
-                            )
-                        )
-                        msg = "Command not executed: denied by user"
-                        raise self._NonTerminatingException(msg)  # noqa: TRY301
+        def execute_action(self, action: dict) -> dict:  # type: ignore[override]
+            tool_id = self._approved_tool_id
+            self._approved_tool_id = None
+            if tool_id is None:
+                msg = "Command not executed: no approved tool call"
+                raise self._NonTerminatingException(msg)
 
+            try:
+                # Mark in progress
+                update = ToolCallProgress.model_construct(
+                    tool_call_id=tool_id, status="in_progress"
+                )
+                self._schedule(self._send(update))
+                self.env.on_output = functools.partial(self._report_output, tool_id)
                 try:
-                    # Mark in progress
-                    update = ToolCallProgress(tool_call_id=tool_id, status="in_progress")
-                    self._schedule(self._send(update))
                     result = super().execute_action(action)
-                    output = result.get("output", "")
-                    returncode = int(result.get("returncode", 0) or 0)
-                    self._schedule(
-                        self.on_tool_complete(
-                            tool_id, output, returncode, status="completed"
-                        )
-                    )
-                except self._Submitted as e:  # type: ignore[misc]
-                    final_text = str(e)
-                    self._schedule(
-                        self.on_tool_complete(tool_id, final_text, 0, status="completed")
-                    )
-                    raise
-                except self._NonTerminatingException as e:  # type: ignore[misc]
-                    msg = str(e)
-                    status = (
-                        "cancelled"
-                        if any(
-                            key in msg
-                            for key in (
-                                "Command not executed",
-                                "Switching to human mode",
-                                "switched to manual mode",
-                                "Interrupted by user",
-                            )
-                        )
-                        else "failed"
-                    )
-                    self._schedule(
-                        self.on_tool_complete(
-                            tool_id,
-                            msg,
-                            124 if status != "cancelled" else 0,
-                            status=status,
-                        )
-                    )
-                    raise
-                except Exception as e:  # include other failures
-                    msg = str(e) or "execution failed"
-                    self._schedule(
-                        self.on_tool_complete(tool_id, msg, 124, status="failed")
+                finally:
+                    self.env.on_output = None
+                output = result.get("output", "")
+                returncode = int(result.get("returncode", 0) or 0)
+                self._schedule(
+                    self.on_tool_complete(tool_id, output, returncode, status="completed")
+                )
+            except self._Submitted as e:  # type: ignore[misc]
+                final_text = str(e)
+                self._schedule(
+                    self.on_tool_complete(tool_id, final_text, 0, status="completed")
+                )
+                raise
+            except self._NonTerminatingException as e:  # type: ignore[misc]
+                msg = str(e)
+                cancelled = _CANCEL_RE.search(msg) is not None
+                # ToolCallProgress has no cancelled status, and nothing validates
+                # it anymore; a cancelled step is a failure with returncode 0
+                self._schedule(
+                    self.on_tool_complete(
+                        tool_id, msg, 0 if cancelled else 124, status="failed"
                     )
-                    raise
-                else:
-                    return result
+                )
+                raise
+            except Exception as e:  # include other failures
+                msg = str(e) or "execution failed"
+                self._schedule(self.on_tool_complete(tool_id, msg, 124, status="failed"))
+                raise
+            else:
+                return result
+
+    return _StreamingMiniAgent
 
-        return _StreamingMiniAgent(), None
+
+def _create_streaming_mini_agent(
+    *,
+    client: AgentSideConnection,
+    session_id: str,
+    cwd: str,
+    model_name: str,
+    model_kwargs: dict[str, Any],
+    loop: asyncio.AbstractEventLoop,
+    ext_config: ACPAgentConfig,
+):
+    """Create a DefaultAgent that emits ACP session/update events during execution.
+
+    Returns (agent, error_message_if_any).
+    """
+    if DefaultAgent is None:
+        return None, f"Failed to load mini-swe-agent: {_MINI_IMPORT_ERROR}"
+    try:
+        agent_cls = _streaming_agent_class()
+        agent = agent_cls(
+            client=client,
+            session_id=session_id,
+            cwd=cwd,
+            model_name=model_name,
+            model_kwargs=model_kwargs,
+            loop=loop,
+            ext_config=ext_config,
+        )
     except Exception as e:  # noqa: BLE001
         return None, f"Failed to load mini-swe-agent: {e}"
+    return agent, None
 
 
 class MiniSweACPAgent(Agent):
-    def __init__(self, client: Client) -> None:
+    def __init__(self, client: AgentSideConnection) -> None:
         self._client = client
-        self._sessions: dict[str, dict[str, Any]] = {}
+        self._sessions: dict[str, Session] = {}
+        try:
+            workers = int(os.getenv("MINI_SWE_LLM_WORKERS", DEFAULT_LLM_WORKERS))
+        except ValueError:
+            workers = DEFAULT_LLM_WORKERS
+        # Blocking mini-swe-agent steps run here instead of the loop's default
+        # executor, so busy sessions cannot starve other to_thread users
+        self._llm_pool = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="mini-swe"
+        )
 
     async def initialize(self, _params: InitializeRequest) -> InitializeResponse:
         from acp.schema import AgentCapabilities, PromptCapabilities
@@ -339,27 +755,14 @@ class MiniSweACPAgent(Agent):
             auth_methods=[],
         )
 
-    async def newSession(self, params: NewSessionRequest) -> NewSessionResponse:
+    async def new_session(self, params: NewSessionRequest) -> NewSessionResponse:
         session_id = f"sess-{uuid.uuid4().hex[:12]}"
-        # load config from env for whitelist & confirm_exit
-        cfg = ACPAgentConfig()
-        try:
-            wl = os.getenv("MINI_SWE_WHITELIST", "[]")
-            cfg.whitelist_actions = list(_json.loads(wl)) if wl else []  # type: ignore[assignment]
-        except Exception:  # noqa: BLE001
-            pass
-        ce = os.getenv("MINI_SWE_CONFIRM_EXIT")
-        if ce is not None:
-            cfg.confirm_exit = ce.lower() not in ("0", "false", "no")
-        self._sessions[session_id] = {
-            "cwd": params.cwd,
-            "agent": None,
-            "task": None,
-            "config": cfg,
-        }
+        self._sessions[session_id] = Session(
+            cwd=params.cwd, config=dataclasses.replace(_load_default_config())
+        )
         return NewSessionResponse(session_id=session_id)
 
-    async def loadSession(self, params) -> None:  # type: ignore[override]
+    async def load_session(self, params) -> None:  # type: ignore[override]
         try:
             session_id = params.session_id  # type: ignore[attr-defined]
             cwd = params.cwd  # type: ignore[attr-defined]
@@ -367,121 +770,69 @@ class MiniSweACPAgent(Agent):
             session_id = getattr(params, "sessionId", "sess-unknown")
             cwd = getattr(params, "cwd", str(Path.cwd().resolve()))
         if session_id not in self._sessions:
-            cfg = ACPAgentConfig()
-            try:
-                wl = os.getenv("MINI_SWE_WHITELIST", "[]")
-                cfg.whitelist_actions = list(_json.loads(wl)) if wl else []  # type: ignore[assignment]
-            except Exception:  # noqa: BLE001
-                pass
-            ce = os.getenv("MINI_SWE_CONFIRM_EXIT")
-            if ce is not None:
-                cfg.confirm_exit = ce.lower() not in ("0", "false", "no")
-            self._sessions[session_id] = {
-                "cwd": cwd,
-                "agent": None,
-                "task": None,
-                "config": cfg,
-            }
+            self._sessions[session_id] = Session(
+                cwd=cwd, config=dataclasses.replace(_load_default_config())
+            )
 
     async def authenticate(self, _params: AuthenticateRequest) -> None:
         return None
 
-    async def setSessionMode(
+    async def set_session_mode(
         self, params: SetSessionModeRequest
     ) -> SetSessionModeResponse | None:  # type: ignore[override]
         sess = self._sessions.get(params.session_id)
-        if not sess:
+        if sess is None:
             return SetSessionModeResponse()
         mode = params.mode_id.lower()
         if mode in ("confirm", "yolo", "human"):
-            sess["config"].mode = mode  # type: ignore[attr-defined]
+            sess.config.mode = mode  # type: ignore[assignment]
         return SetSessionModeResponse()
 
-    def _extract_mode_from_blocks(self, blocks) -> ConfirmationMode | None:
-        for b in blocks:
-            if getattr(b, "type", None) == "text":
-                t = getattr(b, "text", "") or ""
-                m = re.search(r"\[\[MODE:([a-zA-Z]+)\]\]", t)
-                if m:
-                    mode = m.group(1).lower()
-                    if mode in ("confirm", "yolo", "human"):
-                        return mode  # type: ignore[return-value]
-        return None
-
-    def _extract_code_from_blocks(self, blocks) -> str | None:
-        for b in blocks:
-            if getattr(b, "type", None) == "text":
-                t = getattr(b, "text", "") or ""
-                actions = re.findall(r"```bash\n(.*?)\n```", t, re.DOTALL)
-                if actions:
-                    return actions[0].strip()
-        return None
-
     async def prompt(self, params: PromptRequest) -> PromptResponse:
         sess = self._sessions.get(params.session_id)
-        if not sess:
-            self._sessions[params.session_id] = {
-                "cwd": str(Path.cwd().resolve()),
-                "agent": None,
-                "task": None,
-                "config": ACPAgentConfig(),
-            }
-            sess = self._sessions[params.session_id]
+        if sess is None:
+            sess = Session(cwd=str(Path.cwd().resolve()))
+            self._sessions[params.session_id] = sess
 
         # Init or reuse agent
-        agent = sess.get("agent")
+        agent = sess.agent
         if agent is None:
-            model_name = os.getenv(
-                "MINI_SWE_MODEL", os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-            )
-            try:
-                import json
-
-                model_kwargs = json.loads(os.getenv("MINI_SWE_MODEL_KWARGS", "{}"))
-                if not isinstance(model_kwargs, dict):
-                    model_kwargs = {}
-            except Exception:  # noqa: BLE001
-                model_kwargs = {}
+            model_name, model_kwargs = _load_model_settings()
             loop = asyncio.get_running_loop()
             agent, err = _create_streaming_mini_agent(
                 client=self._client,
                 session_id=params.session_id,
-                cwd=sess.get("cwd") or str(Path.cwd().resolve()),
+                cwd=sess.cwd or str(Path.cwd().resolve()),
                 model_name=model_name,
-                model_kwargs=model_kwargs,
+                model_kwargs=dict(model_kwargs),
                 loop=loop,
-                ext_config=sess["config"],
+                ext_config=sess.config,
             )
             if err:
-                await self._client.sessionUpdate(
-                    SessionNotification(
+                await self._client.session_update(
+                    SessionNotification.model_construct(
                         session_id=params.session_id,
-                        update=AgentMessageChunk(
-                            content=TextContentBlock(
-                                text=("mini-swe-agent load error: " + err),
-                            ),
-                        ),
+                        update=_msg_chunk("mini-swe-agent load error: " + err),
                     )
                 )
                 return PromptResponse(stop_reason="end_turn")
-            sess["agent"] = agent
+            sess.agent = agent
 
         # Mode is controlled entirely client-side via requestPermission behavior;
         # no control blocks are parsed.
         assert agent
 
+        # The blocks are only needed for a new task or a human-mode command
+        human = sess.config.mode == "human"
+        cmd: str | None = None
+        if not sess.task or human:
+            cmd, task_parts = _parse_prompt_blocks(params.prompt)
+
         # Initialize conversation on first task
-        if not sess.get("task"):
+        if not sess.task:
             # Build task
-            task_parts: list[str] = []
-            for block in params.prompt:
-                btype = getattr(block, "type", None)
-                if btype == "text":
-                    text = getattr(block, "text", "")
-                    if text and not text.strip().startswith("[[MODE:"):
-                        task_parts.append(str(text))
             task = "\n".join(task_parts).strip() or "Help me with the current repository."
-            sess["task"] = task
+            sess.task = task
             agent.extra_template_vars |= {"task": task}
             agent.messages = []
             # Seed templates without emitting updates
@@ -495,20 +846,14 @@ class MiniSweACPAgent(Agent):
             agent._emit_updates = True
 
         # Decide the source of the next action
+        loop = asyncio.get_running_loop()
         try:
-            if sess["config"].mode == "human":
+            if human:
                 # Expect a bash command from the client
-                cmd = self._extract_code_from_blocks(params.prompt)
                 if not cmd:
                     # Ask user to provide a command and return
-                    content = TextContentBlock(
-                        text="Human mode: please submit a bash command."
-                    )
-                    update = AgentMessageChunk(content=content)
-                    notification = SessionNotification(
-                        session_id=params.session_id, update=update
-                    )
-                    await self._client.sessionUpdate(notification)
+                    await agent.send_message("Human mode: please submit a bash command.")
+                    await agent.flush_updates()
                     return PromptResponse(stop_reason="end_turn")
                 # Fabricate assistant message with the command
                 msg_content = f"\n```bash\n{cmd}\n```"
@@ -516,55 +861,65 @@ class MiniSweACPAgent(Agent):
                 response = {"content": msg_content}
             else:
                 # Query the model in a worker thread to keep the event loop free
-                response = await asyncio.to_thread(agent.query)
+                async with sess.llm_sem:
+                    response = await loop.run_in_executor(self._llm_pool, agent.query)
                 # Send cost hint after each model call
                 with contextlib.suppress(Exception):
                     agent._send_cost_hint()
 
-            # Execute and record observation in worker thread
-            await asyncio.to_thread(agent.get_observation, response)
+            # Ask for permission on the loop, then execute and record the
+            # observation in a worker thread
+            await agent.approve_action(response)
+            await loop.run_in_executor(self._llm_pool, agent.get_observation, response)
         except agent._NonTerminatingException as e:  # type: ignore[misc]
             agent.add_message("user", str(e))
         except agent._Submitted as e:
             final_message = str(e)
             agent.add_message("user", final_message)
             # Ask for confirmation / new task if configured
-            if sess["config"].confirm_exit:
-                content = TextContentBlock(
-                    text=(
-                        "Agent finished. Type a new task in the next message to "
-                        " continue, or do nothing to end."
-                    ),
-                )
-                update = AgentMessageChunk(content=content)
-                notification = SessionNotification(
-                    session_id=params.session_id, update=update
+            if sess.config.confirm_exit:
+                await agent.send_message(
+                    "Agent finished. Type a new task in the next message to "
+                    " continue, or do nothing to end."
                 )
-                await self._client.sessionUpdate(notification)
                 # Reset task so that next prompt can set a new one
-                sess["task"] = None
+                sess.task = None
         except agent._LimitsExceeded as e:
             agent.add_message("user", f"Limits exceeded: {e}")
         except Exception as e:  # noqa: BLE001
             # Surface unexpected errors to the client to avoid silent waits
-            content = TextContentBlock(text=f"Error while processing: {e}")
-            await self._client.sessionUpdate(
-                SessionNotification(
-                    session_id=params.session_id,
-                    update=AgentMessageChunk(content=content),
-                )
-            )
+            await agent.send_message(f"Error while processing: {e}")
 
+        # Updates from this turn must reach the client before the response
+        await agent.flush_updates()
         return PromptResponse(stop_reason="end_turn")
 
     async def cancel(self, _params: CancelNotification) -> None:
         return None
 
+    async def close(self) -> None:
+        """Close every session's agent and release the worker threads."""
+        for sess in self._sessions.values():
+            if sess.agent is not None:
+                await sess.agent.close()
+        self._llm_pool.shutdown(wait=False, cancel_futures=True)
+
 
 async def main() -> None:
     reader, writer = await stdio_streams()
-    AgentSideConnection(lambda client: MiniSweACPAgent(client), writer, reader)
-    await asyncio.Event().wait()
+    agents: list[MiniSweACPAgent] = []
+
+    def create_agent(client: AgentSideConnection) -> MiniSweACPAgent:
+        agents.append(MiniSweACPAgent(client))
+        return agents[-1]
+
+    conn = AgentSideConnection(create_agent, writer, reader)
+    try:
+        # Exit once the client closes our stdin
+        await conn.wait_closed()
+    finally:
+        for agent in agents:
+            await agent.close()
 
 
 if __name__ == "__main__":
@@ -1,183 +1,220 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import json
 from pathlib import Path
+import re
 import subprocess
 import sys
-import tempfile
+import urllib.error
 import urllib.request
 
+import anyenv
+from datamodel_code_generator import (
+    DataModelType,
+    InputFileType,
+    LiteralType,
+    PythonVersion,
+    generate,
+)
+
 
 ROOT = Path(__file__).resolve().parents[1]
 
 SCHEMA_URL = "https://raw.githubusercontent.com/zed-industries/agent-client-protocol/refs/heads/main/schema/schema.json"
 META_URL = "https://raw.githubusercontent.com/zed-industries/agent-client-protocol/refs/heads/main/schema/meta.json"
 
-
-def fetch_json(url: str) -> dict:
-    """Fetch JSON data from a URL."""
+# Downloaded bodies and their ETags, so unchanged files are not transferred again
+CACHE_DIR = Path.home() / ".cache" / "pyacp" / "gen_schema"
+
+# Numbered classes emitted by datamodel-code-generator and their proper names
+RENAME_MAP = {
+    # Rename the numbered ones that don't have proper names
+    "SessionUpdate1": "UserMessageChunk",
+    "SessionUpdate2": "AgentMessageChunk",
+    "SessionUpdate3": "AgentThoughtChunk",
+    "SessionUpdate4": "ToolCallStart",
+    "SessionUpdate5": "ToolCallProgress",
+    "SessionUpdate6": "AgentPlan",
+    "SessionUpdate7": "AvailableCommandsUpdate",
+    "SessionUpdate8": "CurrentModeUpdate",
+    # ContentBlock variants - use different names to avoid conflicts
+    "ContentBlock1": "TextContentBlock",
+    "ContentBlock2": "ImageContentBlock",
+    "ContentBlock3": "AudioContentBlock",
+    "ContentBlock4": "ResourceContentBlock",
+    "ContentBlock5": "EmbeddedResourceContentBlock",
+    # ToolCallContent variants - use different names to avoid conflicts
+    "ToolCallContent1": "ContentToolCallContent",
+    "ToolCallContent2": "FileEditToolCallContent",
+    "ToolCallContent3": "TerminalToolCallContent",
+    # RequestPermissionOutcome variants
+    "RequestPermissionOutcome1": "DeniedOutcome",
+    "RequestPermissionOutcome2": "AllowedOutcome",
+    # McpServer variants
+    "McpServer1": "HttpMcpServer",
+    "McpServer2": "SseMcpServer",
+    "McpServer3": "StdioMcpServer",
+    # Other numbered classes
+    "AvailableCommandInput1": "CommandInputHint",
+}
+
+# One pass over the file; word boundaries cover every context a name can
+# appear in (definitions, annotations, unions, calls). Longest names go first
+# in the alternation so e.g. "SessionUpdate10" is never cut short.
+_RENAME_PATTERN = re.compile(
+    r"\b(" + "|".join(map(re.escape, sorted(RENAME_MAP, key=len, reverse=True))) + r")\b"
+)
+
+
+def fetch(url: str) -> Path:
+    """Download a URL into the cache directory and return the cached file.
+
+    The download is skipped if the cached copy is still current.
+    """
+    body_path = CACHE_DIR / url.rsplit("/", 1)[-1]
+    etag_path = body_path.with_suffix(".etag")
+    request = urllib.request.Request(url)
+    if body_path.exists() and etag_path.exists():
+        request.add_header("If-None-Match", etag_path.read_text("utf-8"))
     try:
-        with urllib.request.urlopen(url) as response:
-            return json.loads(response.read().decode("utf-8"))
+        with urllib.request.urlopen(request) as response:
+            body = response.read()
+            etag = response.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        if e.code != 304:  # noqa: PLR2004
+            print(f"Failed to fetch {url}: {e}", file=sys.stderr)
+            sys.exit(1)
+        return body_path
     except Exception as e:  # noqa: BLE001
         print(f"Failed to fetch {url}: {e}", file=sys.stderr)
         sys.exit(1)
 
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    body_path.write_bytes(body)
+    if etag:
+        etag_path.write_text(etag, "utf-8")
+    else:
+        etag_path.unlink(missing_ok=True)
+    return body_path
+
 
 def main() -> None:
-    # Generate schema.py
     schema_out = ROOT / "src" / "acp" / "schema.py"
+    meta_out = ROOT / "src" / "acp" / "meta.py"
+    # Kept with the downloads rather than in the source tree, which gets packaged
+    hash_out = CACHE_DIR / "codegen.hash"
+
+    # Both downloads are independent, so fetch them concurrently
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        schema_future = pool.submit(fetch, SCHEMA_URL)
+        meta_future = pool.submit(fetch, META_URL)
+        schema_path = schema_future.result()
+        meta_path = meta_future.result()
+
+    # Nothing to do if neither the inputs nor this script changed since last time.
+    # The outputs are hashed too, as the cache is shared by every checkout.
+    digest = _digest(schema_path, meta_path, Path(__file__))
+    if (
+        schema_out.exists()
+        and meta_out.exists()
+        and hash_out.exists()
+        and hash_out.read_text("utf-8") == f"{digest} {_digest(schema_out, meta_out)}"
+    ):
+        print("Schema and meta are unchanged, skipping generation")
+        return
 
-    # Create a temporary file for the schema JSON
-    temp_dir = Path(tempfile.gettempdir())
-    temp_schema_path = temp_dir / "schema.json"
-    schema_data = fetch_json(SCHEMA_URL)
-    temp_schema_path.write_text(json.dumps(schema_data, indent=2))
-
-    try:
-        cmd = [
-            sys.executable,
-            "-m",
-            "datamodel_code_generator",
-            "--input",
-            str(temp_schema_path),
-            "--input-file-type",
-            "jsonschema",
-            "--output",
-            str(schema_out),
-            "--target-python-version",
-            "3.12",
-            "--collapse-root-models",
-            "--output-model-type",
-            "pydantic_v2.BaseModel",
-            "--use-annotated",
-            "--use-one-literal-as-default",
-            "--enum-field-as-literal",
-            "all",
-            "--use-double-quotes",
-            "--use-union-operator",
-            "--use-standard-collections",
-            "--use-schema-description",
-            "--allow-population-by-field-name",
-            "--snake-case-field",
-            "--use-generic-container-types",
-        ]
-        subprocess.check_call(cmd)
+    # Generate schema.py
+    # In-process rather than via the CLI, saving an interpreter start-up. The
+    # downloaded file is read as-is; the generator rejects a dict for JSON Schema
+    # and mis-resolves root-level refs when given the raw text.
+    generate(
+        schema_path,
+        input_file_type=InputFileType.JsonSchema,
+        output=schema_out,
+        target_python_version=PythonVersion.PY_312,
+        collapse_root_models=True,
+        output_model_type=DataModelType.PydanticV2BaseModel,
+        use_annotated=True,
+        field_constraints=True,  # implied by --use-annotated on the CLI
+        use_one_literal_as_default=True,
+        enum_field_as_literal=LiteralType.All,
+        use_double_quotes=True,
+        use_union_operator=True,
+        use_standard_collections=True,
+        use_schema_description=True,
+        allow_population_by_field_name=True,
+        snake_case_field=True,
+        use_generic_container_types=True,
+    )
 
-        # Post-process to rename numbered classes
-        _rename_numbered_classes(schema_out)
-    finally:
-        # Clean up temporary file
-        temp_schema_path.unlink(missing_ok=True)
+    # Post-process to rename numbered classes
+    _rename_numbered_classes(schema_out)
 
-    # Generate meta.py
-    meta_out = ROOT / "src" / "acp" / "meta.py"
-    meta_data = fetch_json(META_URL)
+    # Generate meta.py; parses with orjson when the speedups extra is installed
+    meta_data = anyenv.load_json(meta_path.read_bytes(), return_type=dict)
     agent_methods = meta_data.get("agentMethods", {})
     client_methods = meta_data.get("clientMethods", {})
     version = meta_data.get("version", 1)
 
+    # Written already formatted, so only schema.py needs a ruff run
     meta_out.write_text(
         f"# This file is generated from {META_URL}.\n# Do not edit by hand.\n"
-        f"AGENT_METHODS = {agent_methods!r}\n"
-        f"CLIENT_METHODS = {client_methods!r}\n"
-        f"PROTOCOL_VERSION = {int(version)}\n"
+        + _format_dict("AGENT_METHODS", agent_methods)
+        + _format_dict("CLIENT_METHODS", client_methods)
+        + f"PROTOCOL_VERSION = {int(version)}\n"
     )
 
-    # Format generated files with ruff
-    _format_with_ruff(schema_out)
-    _format_with_ruff(meta_out)
+    # Format the generated schema with ruff; on failure, regenerate next time
+    if _format_with_ruff(schema_out):
+        hash_out.write_text(f"{digest} {_digest(schema_out, meta_out)}", "utf-8")
+
 
+def _digest(*paths: Path) -> str:
+    """Return a short content hash over the given files."""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
 
-def _format_with_ruff(file_path: Path) -> None:
-    """Format a Python file with ruff."""
+
+def _format_dict(name: str, mapping: dict[str, str]) -> str:
+    """Render a dict of strings as an assignment, laid out as ruff formats it."""
+    if not mapping:
+        return f"{name} = {{}}\n"
+    # One item per line with a trailing comma, which ruff keeps exploded. JSON
+    # string literals are valid double-quoted Python string literals.
+    items = "".join(
+        f"    {json.dumps(key)}: {json.dumps(value)},\n" for key, value in mapping.items()
+    )
+    return f"{name} = {{\n{items}}}\n"
+
+
+def _format_with_ruff(*file_paths: Path) -> bool:
+    """Format Python files with ruff, returning whether that succeeded."""
     try:
-        cmd = ["uv", "run", "ruff", "format", str(file_path)]
+        # ruff from this environment; going through "uv run" re-resolves it first
+        cmd = [sys.executable, "-m", "ruff", "format", *map(str, file_paths)]
         subprocess.check_call(cmd)
-        print(f"Formatted {file_path}")
+        for file_path in file_paths:
+            print(f"Formatted {file_path}")
     except subprocess.CalledProcessError as e:
-        print(f"Warning: Failed to format {file_path}: {e}", file=sys.stderr)
+        names = ", ".join(map(str, file_paths))
+        print(f"Warning: Failed to format {names}: {e}", file=sys.stderr)
+        return False
+    return True
 
 
 def _rename_numbered_classes(file_path: Path) -> None:
     """Rename numbered classes to more meaningful names."""
-    rename_map = {
-        # Rename the numbered ones that don't have proper names
-        "SessionUpdate1": "UserMessageChunk",
-        "SessionUpdate2": "AgentMessageChunk",
-        "SessionUpdate3": "AgentThoughtChunk",
-        "SessionUpdate4": "ToolCallStart",
-        "SessionUpdate5": "ToolCallProgress",
-        "SessionUpdate6": "AgentPlan",
-        "SessionUpdate7": "AvailableCommandsUpdate",
-        "SessionUpdate8": "CurrentModeUpdate",
-        # ContentBlock variants - use different names to avoid conflicts
-        "ContentBlock1": "TextContentBlock",
-        "ContentBlock2": "ImageContentBlock",
-        "ContentBlock3": "AudioContentBlock",
-        "ContentBlock4": "ResourceContentBlock",
-        "ContentBlock5": "EmbeddedResourceContentBlock",
-        # ToolCallContent variants - use different names to avoid conflicts
-        "ToolCallContent1": "ContentToolCallContent",
-        "ToolCallContent2": "FileEditToolCallContent",
-        "ToolCallContent3": "TerminalToolCallContent",
-        # RequestPermissionOutcome variants
-        "RequestPermissionOutcome1": "DeniedOutcome",
-        "RequestPermissionOutcome2": "AllowedOutcome",
-        # McpServer variants
-        "McpServer1": "HttpMcpServer",
-        "McpServer2": "SseMcpServer",
-        "McpServer3": "StdioMcpServer",
-        # Other numbered classes
-        "AvailableCommandInput1": "CommandInputHint",
-    }
-
-    content = file_path.read_text("utf-8")
-
-    # Replace class definitions and all references
-    # Sort by length descending to avoid partial matches (e.g., avoid replacing
-    # "SessionUpdate1" before "SessionUpdate10")
-    for old_name, new_name in sorted(
-        rename_map.items(), key=lambda x: len(x[0]), reverse=True
-    ):
-        # Replace class definition
-        content = content.replace(f"class {old_name}(", f"class {new_name}(")
-
-        # Replace type annotations and references
-        # Handle standalone usage
-        content = content.replace(f"{old_name} |", f"{new_name} |")
-        content = content.replace(f"| {old_name}", f"| {new_name}")
-        content = content.replace(f": {old_name}", f": {new_name}")
-        content = content.replace(f"[{old_name}]", f"[{new_name}]")
-        content = content.replace(f"List[{old_name}]", f"List[{new_name}]")
-        content = content.replace(f"Optional[{old_name}]", f"Optional[{new_name}]")
-        content = content.replace(f"Union[{old_name}", f"Union[{new_name}")
-        content = content.replace(f", {old_name}]", f", {new_name}]")
-        content = content.replace(f"({old_name},", f"({new_name},")
-        content = content.replace(f"({old_name})", f"({new_name})")
-
-        # Handle line beginnings and isolated references
-        content = content.replace(f"\n        {old_name}", f"\n        {new_name}")
-        content = content.replace(
-            f"\n            {old_name}", f"\n            {new_name}"
-        )
-        content = content.replace(f" {old_name}(", f" {new_name}(")
-        content = content.replace(f"={old_name}(", f"={new_name}(")
-        content = content.replace(f"return {old_name}(", f"return {new_name}(")
-
-        # Handle imports and root model references
-        content = content.replace(f"[{old_name}])", f"[{new_name}])")
-        content = content.replace(
-            f"root: Annotated[\n        {old_name},",
-            f"root: Annotated[\n        {new_name},",
-        )
-
-        # Handle type union patterns in annotated types
-        content = content.replace(
-            f"Annotated[\n        {old_name}", f"Annotated[\n        {new_name}"
-        )
-
-    file_path.write_text(content)
+    content = _RENAME_PATTERN.sub(
+        lambda m: RENAME_MAP[m.group(1)], file_path.read_text("utf-8")
+    )
+    # Swap the result in atomically so an interrupted run never truncates the file
+    tmp_path = file_path.with_suffix(".py.tmp")
+    tmp_path.write_text(content, "utf-8")
+    tmp_path.replace(file_path)
 
 
 if __name__ == "__main__":
@@ -56,6 +56,12 @@ from acp.schema import (
     WriteTextFileResponse,
 )
 from acp.stdio import stdio_streams
+from acp.framing import (
+    FrameReader,
+    FrameWriter,
+    connect_buffered_read_pipe,
+    open_buffered_connection,
+)
 from acp.exceptions import RequestError
 
 __version__ = "0.0.1"
@@ -124,4 +130,9 @@ __all__ = [  # noqa: RUF022
     "create_session_model_state",
     # stdio helper
     "stdio_streams",
+    # buffered transport
+    "FrameReader",
+    "FrameWriter",
+    "connect_buffered_read_pipe",
+    "open_buffered_connection",
 ]
@@ -3,7 +3,7 @@ from __future__ import annotations
 import asyncio
 import contextlib
 from dataclasses import dataclass
-import json
+import functools
 import logging
 from typing import TYPE_CHECKING, Any
 
@@ -15,9 +15,33 @@ from acp.exceptions import RequestError
 
 logger = logging.getLogger(__name__)
 
+# Flush a batch early once this many bytes are pending to keep streaming latency low
+BATCH_FLUSH_THRESHOLD = 64 * 1024
+
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable
+
     from acp.acp_types import JsonValue, MethodHandler
+    from acp.framing import FrameReader, FrameWriter
+
+
+# Both encoders return UTF-8 bytes directly, skipping a str round trip
+try:
+    import orjson
+except ImportError:  # speedups extra not installed; pydantic-core always is
+    from pydantic_core import to_json as encode_json
+
+    def encode_frame(obj: dict[str, Any]) -> bytes:
+        """Encode a JSON-RPC message as a newline-terminated frame."""
+        return encode_json(obj) + b"\n"
+
+else:
+    encode_json = orjson.dumps
+
+    def encode_frame(obj: dict[str, Any]) -> bytes:
+        """Encode a JSON-RPC message as a newline-terminated frame."""
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
 
 
 @dataclass(slots=True)
@@ -28,18 +52,23 @@ class _Pending:
 class Connection:
     """Minimal JSON-RPC 2.0 connection over newline-delimited JSON frames.
 
-    Using asyncio streams. KISS: only supports StreamReader/StreamWriter.
+    Using asyncio streams. KISS: only supports StreamReader/StreamWriter, or the
+    buffered FrameReader/FrameWriter pair.
 
     - Outgoing messages always include {"jsonrpc": "2.0"}
     - Requests and notifications are dispatched to a single async handler
+    - Requests are handled in tasks off the receive loop, so a handler can itself
+      send a request to the peer (e.g. ask for permission) and await the response
+    - Requests for the same session, and those without a session (initialize,
+      new_session, ...), still run one after another in the order they arrived
     - Responses resolve pending futures by numeric id
     """
 
     def __init__(
         self,
         handler: MethodHandler,
-        writer: asyncio.StreamWriter,
-        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter | FrameWriter,
+        reader: asyncio.StreamReader | FrameReader,
     ) -> None:
         self._handler = handler
         self._writer = writer
@@ -47,6 +76,9 @@ class Connection:
         self._next_request_id = 0
         self._pending: dict[int, _Pending] = {}
         self._write_lock = asyncio.Lock()
+        self._request_tasks: set[asyncio.Task[None]] = set()
+        # Last request task per session id (None for session-less requests)
+        self._request_tails: dict[Any, asyncio.Task[None]] = {}
         self._recv_task = asyncio.create_task(self._receive_loop())
 
     async def close(self) -> None:
@@ -54,8 +86,24 @@ class Connection:
             self._recv_task.cancel()
             with contextlib.suppress(asyncio.CancelledError):
                 await self._recv_task
+        tasks = list(self._request_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
         # Do not close writer here; lifecycle owned by caller
 
+    async def wait_closed(self) -> None:
+        """Wait until the peer closes its end and the receive loop has ended.
+
+        Raises whatever crashed the receive loop.
+        """
+        try:
+            # Shielded so cancelling the waiter does not also stop receiving
+            await asyncio.shield(self._recv_task)
+        except asyncio.CancelledError:
+            if not self._recv_task.cancelled():
+                raise
+
     # --- IO loops ----------------------------------------------------------------
 
     async def _receive_loop(self) -> None:
@@ -86,7 +134,15 @@ class Connection:
         has_id = "id" in message
 
         if method is not None and has_id:
-            await self._handle_request(message)
+            # Responses must keep flowing while the handler runs, so it gets a task
+            # that waits for the previous request of the same session
+            params = message.get("params")
+            key = params.get("sessionId") if isinstance(params, dict) else None
+            previous = self._request_tails.get(key)
+            task = asyncio.create_task(self._handle_request(message, previous))
+            self._request_tails[key] = task
+            self._request_tasks.add(task)
+            task.add_done_callback(functools.partial(self._request_done, key))
         elif method is not None and not has_id:
             await self._handle_notification(message)
         elif has_id:
@@ -94,8 +150,19 @@ class Connection:
         else:
             logger.warning("🔧 Unrecognized message format: %s", message)
 
-    async def _handle_request(self, message: dict[str, Any]) -> None:
-        """Handle JSON-RPC request."""
+    def _request_done(self, key: Any, task: asyncio.Task[None]) -> None:
+        self._request_tasks.discard(task)
+        if self._request_tails.get(key) is task:
+            del self._request_tails[key]
+
+    async def _handle_request(
+        self, message: dict[str, Any], previous: asyncio.Task[None] | None = None
+    ) -> None:
+        """Handle JSON-RPC request, once the request before it has been handled."""
+        if previous is not None:
+            # wait() rather than await, so a failed or cancelled predecessor
+            # does not cancel this request too
+            await asyncio.wait((previous,))
         payload = {"jsonrpc": "2.0", "id": message["id"]}
         try:
             result = await self._handler(message["method"], message.get("params"), False)
@@ -137,12 +204,40 @@ class Connection:
             fut.future.set_result(None)
 
     async def _send_obj(self, obj: dict[str, Any]) -> None:
-        data = (json.dumps(obj, separators=(",", ":")) + "\n").encode("utf-8")
+        data = encode_frame(obj)
         async with self._write_lock:
             self._writer.write(data)
-            with contextlib.suppress(ConnectionError, RuntimeError):
-                # Peer closed; let reader loop end naturally
-                await self._writer.drain()
+            await self._drain()
+
+    async def _send_objs(self, objs: Iterable[dict[str, Any]]) -> None:
+        await self._write_frames(encode_frame(obj) for obj in objs)
+
+    async def _write_frames(self, frames: Iterable[bytes]) -> None:
+        """Write frames, coalescing them into as few writes as possible.
+
+        Frames are handed to the transport via writelines, which allows a vectored
+        write without concatenating them into one intermediate buffer first.
+        Large batches are flushed early to keep latency low, but the writer is only
+        drained once, after the whole batch has been written.
+        """
+        batch: list[bytes] = []
+        size = 0
+        async with self._write_lock:
+            for frame in frames:
+                batch.append(frame)
+                size += len(frame)
+                if size >= BATCH_FLUSH_THRESHOLD:
+                    self._writer.writelines(batch)
+                    batch = []
+                    size = 0
+            if batch:
+                self._writer.writelines(batch)
+            await self._drain()
+
+    async def _drain(self) -> None:
+        with contextlib.suppress(ConnectionError, RuntimeError):
+            # Peer closed; let reader loop end naturally
+            await self._writer.drain()
 
     # --- Public API --------------------------------------------------------------
 
@@ -161,3 +256,18 @@ class Connection:
         self, method: str, params: JsonValue | None = None
     ) -> None:
         await self._send_obj({"jsonrpc": "2.0", "method": method, "params": params})
+
+    async def send_notifications(
+        self, method: str, params: Iterable[JsonValue | None]
+    ) -> None:
+        """Send one notification per entry of `params` as a single batched write.
+
+        `params` is consumed lazily, each entry being encoded just before it is
+        written.
+        """
+        objs = ({"jsonrpc": "2.0", "method": method, "params": p} for p in params)
+        await self._send_objs(objs)
+
+    async def send_frames(self, frames: Iterable[bytes]) -> None:
+        """Send pre-encoded, newline-terminated frames as a batched write."""
+        await self._write_frames(frames)
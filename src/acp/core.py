@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from typing import TYPE_CHECKING, Any, Protocol
 
-from acp.connection import Connection
+from acp.connection import Connection, encode_frame, encode_json
 from acp.exceptions import RequestError
 from acp.meta import AGENT_METHODS, CLIENT_METHODS
 from acp.schema import (
+    AgentMessageChunk,
     AuthenticateRequest,
     AuthenticateResponse,
     CancelNotification,
@@ -36,6 +38,7 @@ from acp.schema import (
     SetSessionModeResponse,
     TerminalOutputRequest,
     TerminalOutputResponse,
+    TextContentBlock,
     WaitForTerminalExitRequest,
     WaitForTerminalExitResponse,
     WriteTextFileRequest,
@@ -45,11 +48,12 @@ from acp.schema import (
 
 if TYPE_CHECKING:
     import asyncio
-    from collections.abc import Callable, Sequence
+    from collections.abc import Callable, Iterable, Sequence
 
     from tokonomics.model_discovery.model_info import ModelInfo as TokoModelInfo
 
     from acp.acp_types import MethodHandler
+    from acp.framing import FrameReader, FrameWriter
 
 
 class NoMatch:
@@ -58,6 +62,9 @@ class NoMatch:
 
 _NO_MATCH = NoMatch()
 
+# Placeholder spliced out of pre-rendered message chunk frames
+_TEXT_PLACEHOLDER = "\x00acp-text\x00"
+
 
 class BaseClient(Protocol):
     """Base client interface for ACP - always required."""
@@ -190,25 +197,50 @@ class AgentSideConnection(Client):
 
     Args:
         to_agent: factory that receives this connection and returns your Agent
-        input: asyncio.StreamWriter (local -> peer)
-        output: asyncio.StreamReader (peer -> local)
+        input: asyncio.StreamWriter or FrameWriter (local -> peer)
+        output: asyncio.StreamReader or FrameReader (peer -> local)
     """
 
     def __init__(
         self,
         to_agent: Callable[[AgentSideConnection], Agent],
-        input_stream: asyncio.StreamWriter,
-        output_stream: asyncio.StreamReader,
+        input_stream: asyncio.StreamWriter | FrameWriter,
+        output_stream: asyncio.StreamReader | FrameReader,
     ) -> None:
         agent = to_agent(self)
         handler = _create_agent_handler(agent)
         self._conn = Connection(handler, input_stream, output_stream)
 
+    async def wait_closed(self) -> None:
+        """Wait until the peer closes the connection."""
+        await self._conn.wait_closed()
+
     # client-bound methods (agent -> client)
     async def session_update(self, params: SessionNotification) -> None:
         dct = params.model_dump(by_alias=True, exclude_none=True)
         await self._conn.send_notification(CLIENT_METHODS["session_update"], dct)
 
+    async def session_update_batch(
+        self, notifications: Iterable[SessionNotification]
+    ) -> None:
+        """Send several session updates, flushing them to the peer in one write.
+
+        Each notification is serialized as soon as it is produced, so a generator
+        may yield the same instance repeatedly, mutated between yields.
+        """
+        dcts = (n.model_dump(by_alias=True, exclude_none=True) for n in notifications)
+        await self._conn.send_notifications(CLIENT_METHODS["session_update"], dcts)
+
+    async def send_message_chunks(self, session_id: str, texts: Iterable[str]) -> None:
+        """Stream plain-text agent message chunks in one batched write.
+
+        Equivalent to a session_update with an AgentMessageChunk per text, but the
+        frame is rendered once and only the JSON-escaped text is spliced in per chunk.
+        """
+        head, tail = _render_text_chunk_template(session_id)
+        frames = (head + encode_json(text) + tail for text in texts)
+        await self._conn.send_frames(frames)
+
     async def request_permission(
         self, params: RequestPermissionRequest
     ) -> RequestPermissionResponse:
@@ -284,6 +316,24 @@ class AgentSideConnection(Client):
         )
 
 
+@lru_cache(maxsize=256)
+def _render_text_chunk_template(session_id: str) -> tuple[bytes, bytes]:
+    """Render an agent_message_chunk frame, split around its text value.
+
+    Cached per session, since every prompt of a session streams the same envelope.
+    """
+    content = TextContentBlock.model_construct(text=_TEXT_PLACEHOLDER)
+    update = AgentMessageChunk.model_construct(content=content)
+    notification = SessionNotification.model_construct(
+        session_id=session_id, update=update
+    )
+    params = notification.model_dump(by_alias=True, exclude_none=True)
+    msg = {"jsonrpc": "2.0", "method": CLIENT_METHODS["session_update"], "params": params}
+    marker = encode_json(_TEXT_PLACEHOLDER)
+    head, _, tail = encode_frame(msg).partition(marker)
+    return head, tail
+
+
 class ClientSideConnection(Agent):
     """Client-side connection.
 
@@ -291,21 +341,25 @@ class ClientSideConnection(Agent):
 
     Args:
       to_client: factory that receives this connection and returns your Client
-      input: asyncio.StreamWriter (local -> peer)
-      output: asyncio.StreamReader (peer -> local)
+      input: asyncio.StreamWriter or FrameWriter (local -> peer)
+      output: asyncio.StreamReader or FrameReader (peer -> local)
     """
 
     def __init__(
         self,
         to_client: Callable[[Agent], Client],
-        input_stream: asyncio.StreamWriter,
-        output_stream: asyncio.StreamReader,
+        input_stream: asyncio.StreamWriter | FrameWriter,
+        output_stream: asyncio.StreamReader | FrameReader,
     ) -> None:
         # Build client first so handler can delegate
         client = to_client(self)
         handler = self._create_handler(client)
         self._conn = Connection(handler, input_stream, output_stream)
 
+    async def wait_closed(self) -> None:
+        """Wait until the peer closes the connection."""
+        await self._conn.wait_closed()
+
     def _create_handler(self, client: Client) -> MethodHandler:
         """Create the method handler for client-side connection."""
 
@@ -0,0 +1,349 @@
+"""Single-copy reader for newline-delimited JSON-RPC frames."""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextlib
+import os
+import stat
+from typing import TYPE_CHECKING, Any
+
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+# Largest frame accepted before the reader fails, like StreamReader's `limit`
+DEFAULT_FRAME_LIMIT = 16 << 20
+# Pause the transport once this many parsed frames are waiting to be consumed
+MAX_PENDING_FRAMES = 1024
+
+
+class FrameReader(asyncio.BufferedProtocol):
+    """Protocol that reads directly into a preallocated buffer and splits frames.
+
+    Transports receive straight into `buffer` via `get_buffer`, so every frame is
+    copied exactly once (when it is sliced out), instead of going through the chunk
+    list and line buffer of an `asyncio.StreamReader`.
+
+    Implements the `readline` part of the StreamReader interface used by
+    `Connection`, so it can be passed to `ClientSideConnection` / `AgentSideConnection`
+    in place of a StreamReader. It also tracks write flow control for a `FrameWriter`
+    on the same transport.
+
+    A frame longer than `limit` makes `readline` raise `ValueError`, as it does on
+    a StreamReader, once the frames received before it have been returned.
+    """
+
+    def __init__(
+        self, buffer_size: int = DEFAULT_BUFFER_SIZE, limit: int = DEFAULT_FRAME_LIMIT
+    ) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._buffer_size = buffer_size
+        self._limit = limit
+        self._buffer = bytearray(buffer_size)
+        self._start = 0  # first byte of the incomplete frame
+        self._end = 0  # end of valid data
+        self._frames: collections.deque[bytes] = collections.deque()
+        self._eof = False
+        self._exception: BaseException | None = None
+        self._waiter: asyncio.Future[None] | None = None
+        self._transport: asyncio.BaseTransport | None = None
+        self._reading_paused = False
+        self._connection_lost = False
+        self._closed: asyncio.Future[None] = self._loop.create_future()
+        # write flow control, see `_wait_writable`
+        self._writing_paused = False
+        self._drain_waiters: collections.deque[asyncio.Future[None]] = collections.deque()
+
+    # --- asyncio.BufferedProtocol ------------------------------------------------
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._transport = transport
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        if exc is not None:
+            self._exception = exc
+        self._connection_lost = True
+        self._eof = True
+        self._wakeup()
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        if not self._closed.done():
+            self._closed.set_result(None)
+
+    def eof_received(self) -> bool:
+        self._eof = True
+        self._wakeup()
+        return False
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        if self._start == self._end:
+            # Everything consumed; start over at the front, dropping any growth
+            # a large frame caused
+            self._start = self._end = 0
+            if len(self._buffer) > self._buffer_size:
+                self._buffer = bytearray(self._buffer_size)
+        elif self._end == len(self._buffer):
+            # Out of room: move the incomplete frame to the front, growing the
+            # buffer first if that frame alone fills more than half of it
+            pending = self._end - self._start
+            if pending * 2 > len(self._buffer):
+                self._buffer.extend(bytes(len(self._buffer)))
+            self._buffer[:pending] = self._buffer[self._start : self._end]
+            self._start, self._end = 0, pending
+        return memoryview(self._buffer)[self._end :]
+
+    def buffer_updated(self, nbytes: int) -> None:
+        scan = self._end
+        self._end += nbytes
+        buffer = self._buffer
+        with memoryview(buffer) as view:
+            while (idx := buffer.find(b"\n", scan, self._end)) != -1:
+                if idx + 1 - self._start > self._limit:
+                    self._overrun("Separator is found, but chunk is longer than limit")
+                    return
+                self._frames.append(view[self._start : idx + 1].tobytes())
+                self._start = scan = idx + 1
+        if self._end - self._start > self._limit:
+            self._overrun("Separator is not found, and chunk exceed the limit")
+            return
+        if self._frames:
+            self._wakeup()
+            if len(self._frames) >= MAX_PENDING_FRAMES:
+                self._pause_reading()
+
+    def data_received(self, data: bytes) -> None:
+        """Fallback for transports without buffered protocol support."""
+        view = memoryview(data)
+        while view:
+            with self.get_buffer(len(view)) as target:
+                n = min(len(target), len(view))
+                target[:n] = view[:n]
+            self.buffer_updated(n)
+            view = view[n:]
+
+    def pause_writing(self) -> None:
+        self._writing_paused = True
+
+    def resume_writing(self) -> None:
+        self._writing_paused = False
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    # --- StreamReader-compatible API --------------------------------------------
+
+    async def readline(self) -> bytes:
+        """Return the next complete frame, or b"" once the peer closed the stream."""
+        while not self._frames:
+            if self._exception is not None:
+                raise self._exception
+            if self._eof:
+                # Hand out a trailing frame without newline, like StreamReader does
+                tail = bytes(self._buffer[self._start : self._end])
+                self._start = self._end
+                return tail
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        frame = self._frames.popleft()
+        if self._reading_paused and len(self._frames) < MAX_PENDING_FRAMES // 2:
+            self._resume_reading()
+        return frame
+
+    def at_eof(self) -> bool:
+        return self._eof and not self._frames and self._start == self._end
+
+    # --- helpers -------------------------------------------------------------------
+
+    async def _wait_writable(self) -> None:
+        if self._connection_lost:
+            msg = "Connection lost"
+            raise ConnectionResetError(msg)
+        if not self._writing_paused:
+            return
+        # One waiter per caller, so concurrent drains are all released
+        waiter = self._loop.create_future()
+        self._drain_waiters.append(waiter)
+        try:
+            await waiter
+        finally:
+            self._drain_waiters.remove(waiter)
+        if self._connection_lost:
+            msg = "Connection lost"
+            raise ConnectionResetError(msg)
+
+    def _overrun(self, msg: str) -> None:
+        # Drop the oversized data and stop reading; readline raises once the
+        # frames before it are consumed
+        self._start = self._end = 0
+        self._exception = ValueError(msg)
+        self._pause_reading()
+        self._wakeup()
+
+    def _wakeup(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _pause_reading(self) -> None:
+        if isinstance(self._transport, asyncio.ReadTransport):
+            with contextlib.suppress(RuntimeError):
+                self._transport.pause_reading()
+                self._reading_paused = True
+
+    def _resume_reading(self) -> None:
+        if isinstance(self._transport, asyncio.ReadTransport):
+            with contextlib.suppress(RuntimeError):
+                self._transport.resume_reading()
+        self._reading_paused = False
+
+
+class FrameWriter:
+    """The write half of a `FrameReader` connection.
+
+    Provides the subset of the `asyncio.StreamWriter` interface that `Connection`
+    uses, with flow control driven by the `FrameReader` protocol.
+    """
+
+    def __init__(self, transport: asyncio.WriteTransport, protocol: FrameReader) -> None:
+        self._transport = transport
+        self._protocol = protocol
+
+    @property
+    def transport(self) -> asyncio.WriteTransport:
+        return self._transport
+
+    def write(self, data: bytes) -> None:
+        self._transport.write(data)
+
+    def writelines(self, data: Iterable[bytes]) -> None:
+        self._transport.writelines(data)
+
+    async def drain(self) -> None:
+        await self._protocol._wait_writable()
+
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        return self._transport.get_extra_info(name, default)
+
+    def is_closing(self) -> bool:
+        return self._transport.is_closing()
+
+    def close(self) -> None:
+        self._transport.close()
+
+    async def wait_closed(self) -> None:
+        """Wait until the transport has called `connection_lost`."""
+        await asyncio.shield(self._protocol._closed)
+
+
+class _ReadPipeTransport(asyncio.ReadTransport):
+    """Read transport that `readv`s from a pipe straight into a `FrameReader` buffer.
+
+    asyncio's own pipe transport only supports `data_received`, which costs an extra
+    copy per read.
+    """
+
+    def __init__(
+        self, loop: asyncio.AbstractEventLoop, pipe: Any, protocol: FrameReader
+    ) -> None:
+        super().__init__({"pipe": pipe})
+        self._loop = loop
+        self._pipe = pipe
+        self._fileno = pipe.fileno()
+        self._protocol = protocol
+        self._closing = False
+        self._paused = False
+        mode = os.fstat(self._fileno).st_mode
+        if not (stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or stat.S_ISCHR(mode)):
+            msg = "Pipe transport is for pipes/sockets only."
+            raise ValueError(msg)
+        # Raises NotImplementedError on loops without readiness callbacks
+        loop.add_reader(self._fileno, self._read_ready)
+        os.set_blocking(self._fileno, False)
+        protocol.connection_made(self)
+
+    def _read_ready(self) -> None:
+        try:
+            with self._protocol.get_buffer(-1) as buf:
+                nbytes = os.readv(self._fileno, [buf])
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as exc:
+            self._close(exc)
+            return
+        if nbytes:
+            self._protocol.buffer_updated(nbytes)
+            return
+        self._loop.remove_reader(self._fileno)
+        self._protocol.eof_received()
+        self._close(None)
+
+    def is_reading(self) -> bool:
+        return not self._paused and not self._closing
+
+    def pause_reading(self) -> None:
+        if self._closing or self._paused:
+            return
+        self._paused = True
+        self._loop.remove_reader(self._fileno)
+
+    def resume_reading(self) -> None:
+        if self._closing or not self._paused:
+            return
+        self._paused = False
+        self._loop.add_reader(self._fileno, self._read_ready)
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def close(self) -> None:
+        self._close(None)
+
+    def _close(self, exc: Exception | None) -> None:
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._fileno)
+        self._loop.call_soon(self._call_connection_lost, exc)
+
+    def _call_connection_lost(self, exc: Exception | None) -> None:
+        try:
+            self._protocol.connection_lost(exc)
+        finally:
+            self._pipe.close()
+
+
+async def open_buffered_connection(
+    host: str | None = None, port: int | None = None, **kwargs: Any
+) -> tuple[FrameReader, FrameWriter]:
+    """Open a TCP connection that reads frames through a `FrameReader`.
+
+    Drop-in replacement for `asyncio.open_connection` when the result is passed on
+    to a `ClientSideConnection` or `AgentSideConnection`.
+    """
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_connection(FrameReader, host, port, **kwargs)
+    return protocol, FrameWriter(transport, protocol)
+
+
+async def connect_buffered_read_pipe(
+    pipe: Any, buffer_size: int = DEFAULT_BUFFER_SIZE, limit: int = DEFAULT_FRAME_LIMIT
+) -> FrameReader:
+    """Read frames from a pipe (e.g. a subprocess stdout) through a `FrameReader`.
+
+    The pipe is closed once the reader hits EOF. Event loops without `add_reader`
+    support fall back to `connect_read_pipe`, which adds one copy per read.
+    """
+    loop = asyncio.get_running_loop()
+    protocol = FrameReader(buffer_size, limit)
+    try:
+        _ReadPipeTransport(loop, pipe, protocol)
+    except NotImplementedError:
+        await loop.connect_read_pipe(lambda: protocol, pipe)
+    return protocol
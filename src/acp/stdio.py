@@ -6,7 +6,17 @@ import contextlib
 import logging
 import platform
 import sys
-from typing import Any, cast
+import time
+from typing import TYPE_CHECKING, Any, cast
+
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+
+WRITE_BUFFER_HIGH_WATER = 1 << 20
+# How long to back off when a non-blocking stdout is full
+WRITE_RETRY_DELAY = 0.001
 
 
 class _WritePipeProtocol(asyncio.BaseProtocol):
@@ -53,13 +63,36 @@ def _start_stdin_feeder(
 class _StdoutTransport(asyncio.BaseTransport):
     def __init__(self) -> None:
         self._is_closing = False
+        # Frames go to the raw file, so emit anything still buffered above it first
+        sys.stdout.flush()
+        # With -u / PYTHONUNBUFFERED the buffer already is the raw FileIO
+        self._raw = getattr(sys.stdout.buffer, "raw", sys.stdout.buffer)
+
+    def _write_all(self, data: bytes) -> None:
+        # Raw writes may be partial; BufferedWriter would cost an extra copy
+        view = memoryview(data)
+        while view:
+            written = self._raw.write(view)
+            if written is None:
+                # Non-blocking fd with a full pipe: nothing was written, so give
+                # the reader a moment instead of spinning
+                time.sleep(WRITE_RETRY_DELAY)
+                continue
+            view = view[written:]
 
     def write(self, data: bytes) -> None:
         if self._is_closing:
             return
         try:
-            sys.stdout.buffer.write(data)
-            sys.stdout.buffer.flush()
+            self._write_all(data)
+        except Exception:
+            logging.exception("Error writing to stdout")
+
+    def writelines(self, list_of_data: Iterable[bytes]) -> None:
+        if self._is_closing:
+            return
+        try:
+            self._write_all(b"".join(list_of_data))
         except Exception:
             logging.exception("Error writing to stdout")
 
@@ -105,9 +138,13 @@ async def _posix_stdio_streams(
     reader_protocol = asyncio.StreamReaderProtocol(reader)
     await loop.connect_read_pipe(lambda: reader_protocol, sys.stdin)
 
-    # Writer to stdout with protocol providing _drain_helper
+    # Writer to stdout with protocol providing _drain_helper. The transport writes
+    # to the fd directly, so flush Python-level buffers first to keep output ordered.
+    sys.stdout.flush()
     write_protocol = _WritePipeProtocol()
     transport, _ = await loop.connect_write_pipe(lambda: write_protocol, sys.stdout)
+    # Allow bursts of streamed notifications without pausing for backpressure
+    transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH_WATER)
     writer = asyncio.StreamWriter(transport, write_protocol, None, loop)
     return reader, writer
 
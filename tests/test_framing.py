@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import sys
+from typing import TYPE_CHECKING
+
+import pytest
+
+from acp import (
+    AgentSideConnection,
+    ClientSideConnection,
+    FrameReader,
+    FrameWriter,
+    InitializeRequest,
+    NewSessionRequest,
+    connect_buffered_read_pipe,
+    open_buffered_connection,
+)
+from acp.framing import MAX_PENDING_FRAMES
+
+
+if TYPE_CHECKING:
+    from acp import DefaultACPClient
+
+    from .conftest import TestAgent
+
+
+class _FakeTransport(asyncio.Transport):
+    def __init__(self) -> None:
+        super().__init__()
+        self.paused = False
+        self.written: list[bytes] = []
+
+    def pause_reading(self) -> None:
+        self.paused = True
+
+    def resume_reading(self) -> None:
+        self.paused = False
+
+    def writelines(self, list_of_data) -> None:
+        self.written.extend(list_of_data)
+
+
+def _feed(reader: FrameReader, data: bytes) -> None:
+    """Push data through the buffered protocol path like a socket transport would."""
+    view = memoryview(data)
+    while view:
+        buf = reader.get_buffer(-1)
+        n = min(len(buf), len(view))
+        buf[:n] = view[:n]
+        del buf
+        reader.buffer_updated(n)
+        view = view[n:]
+
+
+async def test_frames_split_across_reads() -> None:
+    reader = FrameReader(buffer_size=16)
+    _feed(reader, b'{"a":')
+    _feed(reader, b'1}\n{"b":2}\n{"c"')
+    _feed(reader, b":3}\n")
+    reader.eof_received()
+    assert await reader.readline() == b'{"a":1}\n'
+    assert await reader.readline() == b'{"b":2}\n'
+    assert await reader.readline() == b'{"c":3}\n'
+    assert await reader.readline() == b""
+
+
+async def test_frame_larger_than_buffer_grows_it() -> None:
+    reader = FrameReader(buffer_size=8)
+    frame = b"x" * 100 + b"\n"
+    _feed(reader, frame)
+    assert await reader.readline() == frame
+
+
+async def test_frame_over_limit_raises_after_earlier_frames() -> None:
+    reader = FrameReader(buffer_size=8, limit=16)
+    _feed(reader, b"ok\n" + b"x" * 32)
+    assert await reader.readline() == b"ok\n"
+    with pytest.raises(ValueError, match="chunk exceed the limit"):
+        await reader.readline()
+
+
+async def test_complete_frame_over_limit_raises() -> None:
+    reader = FrameReader(buffer_size=64, limit=16)
+    _feed(reader, b"x" * 20 + b"\n")
+    with pytest.raises(ValueError, match="chunk is longer than limit"):
+        await reader.readline()
+
+
+async def test_buffer_shrinks_after_large_frame() -> None:
+    buffer_size = 8
+    reader = FrameReader(buffer_size=buffer_size)
+    _feed(reader, b"x" * 100 + b"\n")
+    await reader.readline()
+    assert len(reader.get_buffer(-1)) == buffer_size
+
+
+async def test_data_received_fallback() -> None:
+    reader = FrameReader(buffer_size=8)
+    reader.data_received(b"first\nsecond")
+    reader.data_received(b"\n")
+    reader.eof_received()
+    assert await reader.readline() == b"first\n"
+    assert await reader.readline() == b"second\n"
+    assert await reader.readline() == b""
+
+
+async def test_readline_waits_for_data() -> None:
+    reader = FrameReader()
+    task = asyncio.create_task(reader.readline())
+    await asyncio.sleep(0)
+    assert not task.done()
+    _feed(reader, b"late\n")
+    assert await asyncio.wait_for(task, timeout=1) == b"late\n"
+
+
+@pytest.mark.parametrize("concurrent", [False, True])
+async def test_client_connection_over_frame_reader(
+    test_agent: TestAgent, test_client: DefaultACPClient, concurrent: bool
+) -> None:
+    server_conns: list[AgentSideConnection] = []
+    server_writers: list[asyncio.StreamWriter] = []
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        server_writers.append(writer)
+        server_conns.append(AgentSideConnection(lambda _conn: test_agent, writer, reader))
+
+    server = await asyncio.start_server(handle, host="127.0.0.1", port=0)
+    host, port = server.sockets[0].getsockname()[:2]
+    reader, writer = await open_buffered_connection(host, port)
+    try:
+        conn = ClientSideConnection(lambda _conn: test_client, writer, reader)
+        resp = await conn.initialize(InitializeRequest(protocol_version=1))
+        assert resp.protocol_version == 1
+        requests = [NewSessionRequest(mcp_servers=[], cwd="/test") for _ in range(3)]
+        if concurrent:
+            sessions = await asyncio.gather(*(conn.new_session(r) for r in requests))
+        else:
+            sessions = [await conn.new_session(r) for r in requests]
+        assert [s.session_id for s in sessions] == ["test-session-123"] * 3
+    finally:
+        writer.close()
+        await asyncio.wait_for(writer.wait_closed(), timeout=1)
+        # Since 3.12 Server.wait_closed() also waits for accepted connections
+        for server_writer in server_writers:
+            server_writer.close()
+            with contextlib.suppress(Exception):
+                await server_writer.wait_closed()
+        server.close()
+        await server.wait_closed()
+
+
+async def test_reading_pauses_while_frames_pile_up() -> None:
+    reader = FrameReader()
+    transport = _FakeTransport()
+    reader.connection_made(transport)
+    _feed(reader, b"{}\n" * MAX_PENDING_FRAMES)
+    assert transport.paused
+    for _ in range(MAX_PENDING_FRAMES // 2):
+        await reader.readline()
+    assert transport.paused
+    await reader.readline()
+    assert not transport.paused
+
+
+async def test_connection_lost_with_error_raises_after_pending_frames() -> None:
+    reader = FrameReader()
+    _feed(reader, b"kept\n")
+    reader.connection_lost(ConnectionResetError("peer went away"))
+    assert await reader.readline() == b"kept\n"
+    with pytest.raises(ConnectionResetError, match="peer went away"):
+        await reader.readline()
+
+
+async def test_concurrent_drains_all_resume() -> None:
+    reader = FrameReader()
+    transport = _FakeTransport()
+    reader.connection_made(transport)
+    writer = FrameWriter(transport, reader)
+    reader.pause_writing()
+    drains = [asyncio.create_task(writer.drain()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert not any(d.done() for d in drains)
+    reader.resume_writing()
+    await asyncio.wait_for(asyncio.gather(*drains), timeout=1)
+    reader.connection_lost(None)
+    await asyncio.wait_for(writer.wait_closed(), timeout=1)
+    with pytest.raises(ConnectionResetError):
+        await writer.drain()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs add_reader on pipes")
+async def test_read_pipe_reads_frames_until_eof() -> None:
+    read_fd, write_fd = os.pipe()
+    reader = await connect_buffered_read_pipe(os.fdopen(read_fd, "rb", buffering=0))
+    os.write(write_fd, b'{"a":1}\n{"b"')
+    assert await asyncio.wait_for(reader.readline(), timeout=1) == b'{"a":1}\n'
+    os.write(write_fd, b":2}\n")
+    os.close(write_fd)
+    assert await asyncio.wait_for(reader.readline(), timeout=1) == b'{"b":2}\n'
+    assert await asyncio.wait_for(reader.readline(), timeout=1) == b""
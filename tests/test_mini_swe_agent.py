@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import subprocess
+import time
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from acp import RequestPermissionResponse
+from acp.schema import AllowedOutcome, ToolCallProgress
+
+
+# Keep litellm (imported by mini-swe-agent) from fetching its cost map
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+pytest.importorskip("minisweagent")
+
+from minisweagent.models.test_models import DeterministicModel
+
+from examples.mini_swe_agent import agent as mini
+
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Iterable
+    from pathlib import Path
+
+    from acp import RequestPermissionRequest, SessionNotification
+
+
+class _RecordingClient:
+    """Records everything the agent sends, in the order it reaches the wire."""
+
+    def __init__(self) -> None:
+        self.events: list[str] = []
+
+    async def session_update_batch(
+        self, notifications: Iterable[SessionNotification]
+    ) -> None:
+        self.events.extend(n.update.session_update for n in notifications)
+
+    async def request_permission(
+        self, params: RequestPermissionRequest
+    ) -> RequestPermissionResponse:
+        self.events.append("permission")
+        outcome = AllowedOutcome(option_id="allow-once", outcome="selected")
+        return RequestPermissionResponse(outcome=outcome)
+
+
+@pytest.fixture
+async def streaming_agent(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> AsyncIterator[Any]:
+    def model(**_kwargs: Any) -> DeterministicModel:
+        return DeterministicModel(outputs=[])
+
+    monkeypatch.setattr(mini, "LitellmModel", model)
+    client = _RecordingClient()
+    agent, error = mini._create_streaming_mini_agent(
+        client=client,  # type: ignore[arg-type]
+        session_id="sess",
+        cwd=str(tmp_path),
+        model_name="test",
+        model_kwargs={},
+        loop=asyncio.get_running_loop(),
+        ext_config=mini.ACPAgentConfig(),
+    )
+    assert error is None
+    agent._emit_updates = True
+    yield agent
+    await agent.close()
+
+
+async def test_tool_call_reaches_client_before_permission_request(
+    streaming_agent: Any,
+) -> None:
+    streaming_agent.add_message("assistant", "Listing the files")
+    await streaming_agent.approve_action({"content": "```bash\nls\n```"})
+    await streaming_agent.flush_updates()
+    events = streaming_agent._acp_client.events
+    assert events == ["agent_message_chunk", "tool_call", "permission"]
+
+
+def test_timeout_kills_background_children(streaming_agent: Any) -> None:
+    env = streaming_agent.env
+    env.on_output = lambda _output: None
+    start = time.monotonic()
+    # The background sleep inherits stdout, so killing only the shell would leave
+    # the read blocked until it exits
+    with pytest.raises(subprocess.TimeoutExpired) as exc_info:
+        env.execute("sleep 30 & echo started", timeout=1)
+    assert time.monotonic() - start < 10  # noqa: PLR2004
+    assert exc_info.value.output == b"started\n"
+
+
+def test_batched_output_updates_collapse_to_the_latest() -> None:
+    def output(tool_call_id: str, text: str) -> ToolCallProgress:
+        return ToolCallProgress.model_construct(
+            tool_call_id=tool_call_id,
+            status="in_progress",
+            content=mini._tool_content(text),
+        )
+
+    started = ToolCallProgress.model_construct(tool_call_id="a", status="in_progress")
+    done = ToolCallProgress.model_construct(tool_call_id="a", status="completed")
+    updates = [started, output("a", "1"), output("b", "1"), output("a", "12"), done]
+    assert mini._drop_stale_output(updates) == [
+        started,
+        updates[2],
+        updates[3],
+        done,
+    ]
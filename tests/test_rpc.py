@@ -8,12 +8,16 @@ import anyenv
 import pytest
 
 from acp import (
+    Agent,
     AgentSideConnection,
     CancelNotification,
     ClientSideConnection,
     InitializeRequest,
     InitializeResponse,
     NewSessionRequest,
+    NewSessionResponse,
+    PromptRequest,
+    PromptResponse,
     ReadTextFileRequest,
     SessionNotification,
     SetSessionModeRequest,
@@ -23,6 +27,8 @@ from acp.schema import AgentMessageChunk, TextContentBlock, UserMessageChunk
 
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
     from acp import DefaultACPClient
 
     from .conftest import TestAgent
@@ -121,6 +127,93 @@ async def test_bidirectional_file_ops(
         assert client.files["/test/file.txt"] == "A"
 
 
+async def test_request_handler_can_await_peer_request(
+    test_client: DefaultACPClient,
+) -> None:
+    async with _Server() as s:
+        assert s.client_writer is not None
+        assert s.client_reader is not None
+        assert s.server_writer is not None
+        assert s.server_reader is not None
+        test_client.files["/test/file.txt"] = "from client"
+        seen: list[str] = []
+
+        class ReadingAgent(Agent):
+            async def prompt(self, params: PromptRequest) -> PromptResponse:
+                # Calls back into the client before answering the prompt request
+                req = ReadTextFileRequest(session_id="sess", path="/test/file.txt")
+                seen.append((await client_conn.read_text_file(req)).content)
+                return PromptResponse(stop_reason="end_turn")
+
+        agent_conn = ClientSideConnection(
+            lambda _conn: test_client, s.client_writer, s.client_reader
+        )
+        client_conn = AgentSideConnection(
+            lambda _conn: ReadingAgent(), s.server_writer, s.server_reader
+        )
+
+        request = PromptRequest(
+            session_id="sess", prompt=[TextContentBlock(text="read it")]
+        )
+        resp = await asyncio.wait_for(agent_conn.prompt(request), timeout=1)
+        assert resp.stop_reason == "end_turn"
+        assert seen == ["from client"]
+
+
+async def test_pipelined_requests_run_in_order(
+    test_client: DefaultACPClient,
+) -> None:
+    async with _Server() as s:
+        assert s.client_writer is not None
+        assert s.client_reader is not None
+        assert s.server_writer is not None
+        assert s.server_reader is not None
+        events: list[str] = []
+
+        class SlowInitAgent(Agent):
+            async def initialize(self, params: InitializeRequest) -> InitializeResponse:
+                events.append("init start")
+                await asyncio.sleep(0.01)
+                events.append("init end")
+                return InitializeResponse(
+                    protocol_version=params.protocol_version, agent_capabilities=None
+                )
+
+            async def new_session(self, params: NewSessionRequest) -> NewSessionResponse:
+                events.append("new_session")
+                return NewSessionResponse(session_id="test-session-123")
+
+            async def prompt(self, params: PromptRequest) -> PromptResponse:
+                text = params.prompt[0].text  # type: ignore[union-attr]
+                events.append(f"{params.session_id} {text} start")
+                await asyncio.sleep(0.01)
+                events.append(f"{params.session_id} {text} end")
+                return PromptResponse(stop_reason="end_turn")
+
+        agent_conn = ClientSideConnection(
+            lambda _conn: test_client, s.client_writer, s.client_reader
+        )
+        _client_conn = AgentSideConnection(
+            lambda _conn: SlowInitAgent(), s.server_writer, s.server_reader
+        )
+
+        await asyncio.gather(
+            agent_conn.initialize(InitializeRequest(protocol_version=1)),
+            agent_conn.new_session(NewSessionRequest(mcp_servers=[], cwd="/test")),
+        )
+        assert events == ["init start", "init end", "new_session"]
+
+        events.clear()
+        prompts = [
+            PromptRequest(session_id=sid, prompt=[TextContentBlock(text=text)])
+            for sid, text in (("a", "1"), ("a", "2"), ("b", "1"))
+        ]
+        await asyncio.gather(*(agent_conn.prompt(p) for p in prompts))
+        # Prompts of one session are serialized, other sessions are not held up
+        assert events.index("a 1 end") < events.index("a 2 start")
+        assert events.index("b 1 start") < events.index("a 1 end")
+
+
 async def test_cancel_notification_and_capture_wire(
     test_agent: TestAgent, test_client: DefaultACPClient
 ) -> None:
@@ -185,6 +278,82 @@ async def test_session_notifications_flow(
         assert test_client.notifications[0].session_id == "sess"
 
 
+def _reused_notifications(texts: list[str]) -> Iterator[SessionNotification]:
+    content = TextContentBlock(text="")
+    notification = SessionNotification(
+        session_id="sess", update=AgentMessageChunk(content=content)
+    )
+    for text in texts:
+        content.text = text
+        yield notification
+
+
+@pytest.mark.parametrize("reuse", [False, True])
+async def test_session_update_batch(
+    test_agent: TestAgent, test_client: DefaultACPClient, reuse: bool
+) -> None:
+    async with _Server() as s:
+        assert s.client_writer is not None
+        assert s.client_reader is not None
+        assert s.server_writer is not None
+        assert s.server_reader is not None
+        _agent_conn = ClientSideConnection(
+            lambda _conn: test_client, s.client_writer, s.client_reader
+        )
+        client_conn = AgentSideConnection(
+            lambda _conn: test_agent, s.server_writer, s.server_reader
+        )
+
+        texts = [f"chunk {i}" for i in range(5)]
+        notifications: Iterable[SessionNotification]
+        if reuse:
+            # Items are serialized as they are pulled, so one instance can be mutated
+            notifications = _reused_notifications(texts)
+        else:
+            notifications = [
+                SessionNotification(
+                    session_id="sess",
+                    update=AgentMessageChunk(content=TextContentBlock(text=text)),
+                )
+                for text in texts
+            ]
+        await client_conn.session_update_batch(notifications)
+
+        for _ in range(50):
+            if len(test_client.notifications) >= len(texts):
+                break
+            await asyncio.sleep(0.01)
+        received = [n.update.content.text for n in test_client.notifications]  # type: ignore[union-attr]
+        assert received == texts
+
+
+async def test_send_message_chunks(
+    test_agent: TestAgent, test_client: DefaultACPClient
+) -> None:
+    async with _Server() as s:
+        assert s.client_writer is not None
+        assert s.client_reader is not None
+        assert s.server_writer is not None
+        assert s.server_reader is not None
+        _agent_conn = ClientSideConnection(
+            lambda _conn: test_client, s.client_writer, s.client_reader
+        )
+        client_conn = AgentSideConnection(
+            lambda _conn: test_agent, s.server_writer, s.server_reader
+        )
+
+        texts = ["plain", 'with "quotes"\nand newline', "ünïcödé ✓", ""]
+        await client_conn.send_message_chunks("sess", texts)
+
+        for _ in range(50):
+            if len(test_client.notifications) >= len(texts):
+                break
+            await asyncio.sleep(0.01)
+        assert all(n.session_id == "sess" for n in test_client.notifications)
+        received = [n.update.content.text for n in test_client.notifications]  # type: ignore[union-attr]
+        assert received == texts
+
+
 async def test_concurrent_reads(
     test_agent: TestAgent, test_client: DefaultACPClient
 ) -> None:
@@ -322,5 +491,31 @@ async def test_ignore_invalid_messages(test_agent: TestAgent):
             await asyncio.wait_for(s.client_reader.readline(), timeout=0.1)
 
 
+async def test_wait_closed_returns_on_peer_eof(test_agent: TestAgent):
+    async with _Server() as s:
+        assert s.client_writer is not None
+        assert s.server_writer is not None
+        assert s.server_reader is not None
+        server_conn = AgentSideConnection(
+            lambda _conn: test_agent, s.server_writer, s.server_reader
+        )
+
+        s.client_writer.close()
+        await asyncio.wait_for(server_conn.wait_closed(), timeout=1)
+
+
+async def test_wait_closed_raises_when_receive_loop_crashes(test_agent: TestAgent):
+    async with _Server() as s:
+        assert s.server_writer is not None
+        # A line over the reader limit makes readline() raise inside the loop
+        reader = asyncio.StreamReader(limit=16)
+        server_conn = AgentSideConnection(
+            lambda _conn: test_agent, s.server_writer, reader
+        )
+        reader.feed_data(b"x" * 64 + b"\n")
+        with pytest.raises(ValueError, match="limit"):
+            await asyncio.wait_for(server_conn.wait_closed(), timeout=1)
+
+
 if __name__ == "__main__":
     pytest.main(["-v", __file__])
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import io
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from acp.stdio import _StdoutTransport
+
+
+# Far fewer than a busy retry loop manages while the reader is stalled
+MAX_WRITE_CALLS = 1000
+
+
+class _CountingRaw:
+    def __init__(self, raw: io.RawIOBase) -> None:
+        self._raw = raw
+        self.calls = 0
+
+    def write(self, data: memoryview) -> int | None:
+        self.calls += 1
+        return self._raw.write(data)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs a non-blocking pipe")
+def test_stdout_transport_backs_off_while_pipe_is_full(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(write_fd, False)
+    monkeypatch.setattr(sys, "stdout", io.TextIOWrapper(os.fdopen(write_fd, "wb")))
+    received = bytearray()
+
+    def drain() -> None:
+        # Stall first, so the pipe fills up and raw writes start returning None
+        time.sleep(0.2)
+        while chunk := os.read(read_fd, 1 << 16):
+            received.extend(chunk)
+
+    reader = threading.Thread(target=drain)
+    reader.start()
+    data = b"x" * (1 << 20) + b"\n"
+    transport = _StdoutTransport()
+    raw = transport._raw = _CountingRaw(transport._raw)
+    transport.write(data)
+    sys.stdout.close()
+    reader.join(timeout=5)
+    os.close(read_fd)
+    assert bytes(received) == data
+    assert raw.calls < MAX_WRITE_CALLS